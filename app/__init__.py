@@ -33,16 +33,18 @@ APP_CONTACT: Dict[str, str] = {
 TMP_DIR: str = "tmp_uploads/"
 BOOKS_DIR: str = "books/"
 INDEX_FILE: str = "index.json"
+QUARANTINE_DIR: str = os.getenv("QUARANTINE_DIR", "quarantine/")
+SCRUB_STATE_FILE: str = os.getenv("SCRUB_STATE_FILE", "scrub_state.json")
+# Per-worker metric snapshots, so any worker can serve all workers' metrics. Empty disables sharing.
+METRICS_DIR: str = os.getenv("METRICS_DIR", "metrics/")
 
 # -- Global logging objects ---
+# Records are queued and written by a background thread so that logging never
+# blocks the event loop; see app.services.logs for sampling and rate limiting.
+from app.services.logs import configure_logging
+
 logger = logging.getLogger(APP_NAME)
-logger.setLevel(logging.INFO)
-if not logger.hasHandlers(): # Avoid adding multiple handlers if module is reloaded
-  formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-  ch = logging.StreamHandler()
-  ch.setLevel(logging.INFO)
-  ch.setFormatter(formatter)
-  logger.addHandler(ch)
+configure_logging(logger) # Idempotent if the module is reloaded
 
 
 
@@ -54,6 +56,33 @@ if not logger.hasHandlers(): # Avoid adding multiple handlers if module is reloa
 # and methods in this module
 
 
+def pid_alive(pid: int) -> bool:
+  """
+  Whether a process with this pid is running on this host. Errs on the side
+  of True where it cannot tell (e.g. on Windows).
+  """
+  if pid == os.getpid():
+    return True
+  if os.name == "nt": # os.kill would signal the process
+    return True
+  try:
+    os.kill(pid, 0)
+  except ProcessLookupError:
+    return False
+  except PermissionError:
+    return True
+  return True
+
+
+def is_within_directory(directory: PyPath, target: PyPath) -> bool:
+  """
+  Safely checks if the target path is within the specified directory.
+  Resolves symbolic links to prevent path traversal.
+  """
+  abs_directory = directory.resolve()
+  abs_target = target.resolve() # Resolves target path fully
+  return abs_directory in abs_target.parents or abs_directory == abs_target
+
 def calculate_sha256(filepath: str) -> str:
   """Calculates the SHA256 checksum of a file."""
   sha256_hash = hashlib.sha256()
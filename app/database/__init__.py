@@ -1,10 +1,83 @@
-from sqlmodel import create_engine, SQLModel
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from typing import AsyncIterator, Dict, Any
 import os
+import random
+import logging
+
+from app import APP_NAME
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
 
-engine = create_engine(DATABASE_URL, echo=True)
+# Pool tuning. Sizes apply per worker process, so the total number of
+# connections is roughly workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW).
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+# Statement logging is off by default. When enabled, only a fraction of
+# statements (DB_ECHO_SAMPLE_RATE, 0.0-1.0) is logged.
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() in ("1", "true", "yes")
+DB_ECHO_SAMPLE_RATE = float(os.getenv("DB_ECHO_SAMPLE_RATE", "1.0"))
+
+sql_logger = logging.getLogger(f"{APP_NAME}.sql")
+
+# Async drivers for the URL schemes we accept.
+_ASYNC_DRIVERS: Dict[str, str] = {
+    "postgres": "postgresql+asyncpg",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def async_database_url(url: str) -> str:
+    """Rewrites a plain database URL to use its asyncio driver."""
+    scheme, sep, rest = url.partition("://")
+    return f"{_ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}"
+
+def _engine_options(url: str) -> Dict[str, Any]:
+    options: Dict[str, Any] = {
+        "echo": False,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+    parsed = make_url(url)
+    # In-memory SQLite uses a single static connection; pool sizing does not apply.
+    if not (parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:")):
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+    return options
 
-def init_db():
+ASYNC_DATABASE_URL = async_database_url(DATABASE_URL)
+
+engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options(ASYNC_DATABASE_URL))
+
+async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+if DB_ECHO and DB_ECHO_SAMPLE_RATE > 0:
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _log_sampled_statement(conn, cursor, statement, parameters, context, executemany):
+        if DB_ECHO_SAMPLE_RATE >= 1.0 or random.random() < DB_ECHO_SAMPLE_RATE:
+            sql_logger.info(f"{statement} {parameters!r}")
+
+async def get_session() -> AsyncIterator[AsyncSession]:
+    """FastAPI dependency yielding a database session for the current request."""
+    async with async_session() as session:
+        yield session
+
+async def init_db():
     """Create the database tables."""
-    SQLModel.metadata.create_all(engine)
\ No newline at end of file
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+
+async def close_db():
+    """Dispose of the connection pool."""
+    await engine.dispose()
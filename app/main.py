@@ -1,14 +1,22 @@
 import os
+import datetime
 
 from fastapi import FastAPI
 from app.routes.config import config_router
 from app.routes.register import register_router
 from app.routes.books import books_router
+from app.routes.health import health_router
+from app.routes.metrics import metrics_router
 
 from sqlmodel import Session, select
 
-from app import TMP_DIR, BOOKS_DIR, INDEX_FILE, create_dirs, load_index, save_index
-from app.database import init_db, engine
+from app import TMP_DIR, BOOKS_DIR, INDEX_FILE, logger
+from app.database import init_db, close_db
+from app.services.heartbeats import heartbeat_writer
+from app.services.scrubber import integrity_scrubber
+from app.services.reconcile import startup_reconciler
+from app.services.metrics import MetricsMiddleware, instrument_default_executor, worker_snapshots
+from app.services.logs import LogContextMiddleware
 
 import uvicorn
 import pytz
@@ -34,25 +42,39 @@ application = FastAPI(
 application.include_router(config_router)
 application.include_router(register_router)
 application.include_router(books_router)
+application.include_router(health_router)
+application.include_router(metrics_router)
+application.add_middleware(MetricsMiddleware)
+application.add_middleware(LogContextMiddleware)
 
 @application.on_event("startup")
 async def on_startup():
     start_time = datetime.datetime.now()
-    print("Starting Methodos Operator...")
-    print(f"Books will be stored in: {os.path.abspath(BOOKS_DIR)}")
-    print(f"Index file: {os.path.abspath(INDEX_FILE)}")
-
-    print("Initializing database...")
-    init_db()
-    print("Creating directories if they don't exist...")
-    create_dirs()
-    print(f"Loading Book index from file ({os.path.abspath(INDEX_FILE)}...")
-    await load_index()
-    print("Startup complete.")
+    logger.info("Starting Methodos Operator...")
+    instrument_default_executor()
+    worker_snapshots.start()
+    logger.info(f"Books will be stored in: {os.path.abspath(BOOKS_DIR)}")
+    logger.info(f"Index file: {os.path.abspath(INDEX_FILE)}")
+
+    logger.info("Initializing database...")
+    await init_db()
+    logger.info(f"Reconciling Book index ({os.path.abspath(INDEX_FILE)}) with stored books in the background...")
+    startup_reconciler.start()
+    logger.info("Starting heartbeat writer...")
+    heartbeat_writer.start()
+    logger.info("Starting integrity scrubber...")
+    integrity_scrubber.start()
+    logger.info(f"Startup complete in {(datetime.datetime.now() - start_time).total_seconds():.3f}s.")
 
 @application.on_event("shutdown")
 async def on_shutdown():
-    print("Shutdown complete.")
+    await startup_reconciler.stop()
+    await integrity_scrubber.stop()
+    logger.info("Flushing pending agent heartbeats...")
+    await heartbeat_writer.stop()
+    await close_db()
+    await worker_snapshots.stop()
+    logger.info("Shutdown complete.")
 
 if __name__ == "__main__":
     uvicorn.run(application, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -9,9 +9,13 @@ class Dependency(BaseModel):
   name: str = Field(..., description="Name of the dependency")
   version: str = Field(..., description="Version of the dependency")
 
+# Dot-separated runs of letters, digits, '_', '+' and '-'. Names and versions
+# become the stored filename, so slashes, backslashes and '..' never get through.
+SAFE_NAME_PATTERN = r"^[A-Za-z0-9_+-]+(\.[A-Za-z0-9_+-]+)*$"
+
 class Metadata(BaseModel):
-  name: str = Field(..., description="Name of the book")
-  version: str = Field(..., description="Version of the book")
+  name: str = Field(..., pattern=SAFE_NAME_PATTERN, max_length=128, description="Name of the book")
+  version: str = Field(..., pattern=SAFE_NAME_PATTERN, max_length=64, description="Version of the book")
   description: str = Field(..., description="Description of the book")
   checksum_algorithm: str = Field(..., pattern="^sha256$|^sha512$|^md5$", description="Checksum algorithm used")
   checksum: str = Field(..., description="Checksum of the book")
@@ -32,3 +36,10 @@ class IndexEntry(Metadata):
   book_checksum_algo: str = Field(default="sha256", description="Algorithm used for the book package checksum.")
   book_checksum: str = Field(..., description="Checksum of the entire book package (.book file).")
   book_upload_timestamp: datetime.datetime = Field(..., description="UTC timestamp of when the book was uploaded.")
+
+class RenderRequest(BaseModel):
+  """
+  Per-agent variable values used when rendering a book's chapters on the server.
+  They are merged over the defaults declared in the book's metadata.
+  """
+  variables: Dict[str, Any] = Field(default_factory=dict, description="Variable values overriding the book's declared defaults")
@@ -1,16 +1,22 @@
 from sqlmodel import SQLModel, Field
 from typing import Optional, List
 from uuid import UUID
+from datetime import datetime
 
 class BaseModel(SQLModel):
     id: Optional[int] = Field(default=None, primary_key=True)
-    
+
 class Agent(BaseModel, table=True):
     __tablename__ = "agents"
-    
+
+    uuid: UUID = Field(index=True, unique=True, nullable=False)
     fqdn: str = Field(index=True, nullable=False)
     type: str = Field(index=True, nullable=False)
-    public_key: bytes = Field(index=True, nullable=False)
-    private_key: bytes = Field(index=True, nullable=False)
+    # Keypairs are to be issued at registration (see the TODO in register_agent); empty until then.
+    public_key: Optional[bytes] = Field(default=None, index=True, nullable=True)
+    private_key: Optional[bytes] = Field(default=None, index=True, nullable=True)
     version: str = Field(index=True, nullable=False)
-    state: str = Field(index=True, nullable=False)
\ No newline at end of file
+    state: str = Field(index=True, nullable=False)
+    mode: Optional[str] = Field(default=None, index=True, nullable=True)
+    uptime: Optional[int] = Field(default=None, nullable=True)
+    last_seen: Optional[datetime] = Field(default=None, index=True, nullable=True)
@@ -1,14 +1,11 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime, timedelta
 
-from typing import Optional
-
-from app.models.agent import AgentConfiguration
+from typing import Optional, Dict, Any
 
 import pytz
 
 class AgentConfigurationResponse(BaseModel):
-    generated_at: datetime = datetime.now(tz=pytz.UTC)
-    expires: datetime = datetime.now(tz=pytz.UTC) + timedelta.seconds(3600)
-    configuration: Optional[AgentConfiguration]
-)
\ No newline at end of file
+    generated_at: datetime = Field(default_factory=lambda: datetime.now(tz=pytz.UTC))
+    expires: datetime = Field(default_factory=lambda: datetime.now(tz=pytz.UTC) + timedelta(seconds=3600))
+    configuration: Optional[Dict[str, Any]]
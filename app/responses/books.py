@@ -11,4 +11,13 @@ class UploadResponse(BaseModel):
     book_key: str
     metadata: Metadata
     server_info: Dict[str, Any]
-    
\ No newline at end of file
+
+class RenderResponse(BaseModel):
+    """
+    Represents a book whose chapters have been rendered against a set of variables.
+    """
+    book_key: str
+    book_checksum: str
+    variables_hash: str
+    variables: Dict[str, Any]
+    chapters: Dict[str, str]
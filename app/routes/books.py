@@ -6,12 +6,14 @@ import asyncio
 import aiofiles
 import hashlib
 import datetime
+import time
+import uuid
 
 from pathlib import Path as PyPath
 
 
-from fastapi import APIRouter, HTTPException, status, UploadFile, File, Path, BackgroundTasks
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import APIRouter, HTTPException, status, UploadFile, File, Path, BackgroundTasks, Body
+from fastapi.responses import JSONResponse, FileResponse, Response
 from pydantic import ValidationError
 from typing import List, Any, Dict
 
@@ -19,15 +21,24 @@ try:
   from app import logger 
 
   from app import TMP_DIR, INDEX_FILE, BOOKS_DIR
-  from app import calculate_dir_checksum, calculate_sha256
-  from app.models.books import Metadata, IndexEntry
-  from app.responses.books import UploadResponse
+  from app import calculate_dir_checksum, calculate_sha256, is_within_directory
+  from app.models.books import Metadata, IndexEntry, RenderRequest
+  from app.responses.books import UploadResponse, RenderResponse
+  from app.services.render import book_renderer
+  from app.services.catalog import Catalog
+  from app.services.storage import book_storage
+  from app.services.metrics import registry, TimedLock, UPLOAD_PHASE
 except ImportError as e:
   print(f"Error importing modules: {e}")
   raise
 
-book_index: Dict[str, Dict[str, Any]] = {}
-index_lock = asyncio.Lock()
+book_index: Catalog = Catalog()
+index_lock = TimedLock("index")
+# Set once the index has been loaded and reconciled against BOOKS_DIR at startup.
+# Until then the catalog is not served, so no book is advertised that cannot be downloaded.
+catalog_ready = asyncio.Event()
+
+registry.gauge("methodos_index_books", "Books in the in-memory index.", callback=lambda: len(book_index))
 
 try:
   _TMP_DIR_PATH: PyPath = PyPath(TMP_DIR).resolve(strict=False)
@@ -49,15 +60,6 @@ books_router = APIRouter(
 )
 
 # --- Helper Functions ---
-def _is_within_directory(directory: PyPath, target: PyPath) -> bool:
-  """
-  Safely checks if the target path is within the specified directory.
-  Resolves symbolic links to prevent path traversal.
-  """
-  abs_directory = directory.resolve()
-  abs_target = target.resolve() # Resolves target path fully
-  return abs_directory in abs_target.parents or abs_directory == abs_target
-
 async def _cleanup_temp_paths(paths_to_remove: List[PyPath]):
     """
     Asynchronously cleans up specified temporary files and directories.
@@ -67,28 +69,29 @@ async def _cleanup_temp_paths(paths_to_remove: List[PyPath]):
         try:
             if await asyncio.to_thread(path_to_remove.exists):
                 if await asyncio.to_thread(path_to_remove.is_dir):
-                    logger.info(f"Background cleanup: Removing temporary directory {path_to_remove}")
+                    logger.info(f"Background cleanup: Removing temporary directory {path_to_remove}", extra={"rate_limit": "upload.cleanup"})
                     await asyncio.to_thread(shutil.rmtree, path_to_remove)
                 else:
-                    logger.info(f"Background cleanup: Removing temporary file {path_to_remove}")
+                    logger.info(f"Background cleanup: Removing temporary file {path_to_remove}", extra={"rate_limit": "upload.cleanup"})
                     await asyncio.to_thread(os.remove, path_to_remove)
         except Exception as e:
             logger.error(f"Error during background cleanup of {path_to_remove}: {e}", exc_info=True)
 
+def _require_catalog_ready():
+  """Raises 503 while the catalog is still being reconciled at startup."""
+  if not catalog_ready.is_set():
+    raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Book catalog is not ready yet.")
+
 async def load_index():
   """Loads the index from the JSON file."""
-  global book_index
+  # The catalog is reloaded in place so that modules holding a reference to
+  # `book_index` (background tasks, services) always see the current one.
   async with index_lock:
-    if os.path.exists(_INDEX_FILE_PATH):
-      try:
-        async with aiofiles.open(_INDEX_FILE_PATH, mode='r') as f:
-          content = await f.read()
-          book_index = json.loads(content)
-      except (json.JSONDecodeError, IOError) as e:
-        logger.critical(f"Error loading index file: {e}. Starting with empty index.")
-        book_index = {}
-    else:
-      book_index = {}
+    try:
+      await asyncio.to_thread(book_index.load, _INDEX_FILE_PATH)
+    except (json.JSONDecodeError, KeyError, TypeError, IOError) as e:
+      logger.critical(f"Error loading index file: {e}. Starting with empty index.")
+      book_index.clear()
   
   logger.info(f"Index loaded with {len(book_index)} entries.")
 
@@ -96,12 +99,27 @@ async def save_index():
   """Saves the current index to the JSON file."""
   async with index_lock:
     try:
-      async with aiofiles.open(_INDEX_FILE_PATH, mode="w") as f:
-         await f.write(json.dumps(book_index, indent=2))
-    except IOError as e:
+      await asyncio.to_thread(book_index.save, _INDEX_FILE_PATH)
+    except (OSError, ValueError) as e:
       logger.critical(f"Error saving index file: {e}.")
 
-  logger.info(f"Index saved with {len(book_index)} entries.")
+  logger.info(f"Index saved with {len(book_index)} entries.", extra={"rate_limit": "index.save"})
+
+async def remove_from_index(book_key: str):
+  """
+  Removes a book from the index file and reloads the in-memory index from it,
+  keeping books saved by other workers since this one loaded the index.
+  """
+  async with index_lock:
+    try:
+      await asyncio.to_thread(book_index.remove_saved, _INDEX_FILE_PATH, book_key)
+    except (json.JSONDecodeError, KeyError, TypeError, OSError, ValueError) as e:
+      logger.critical(f"Error removing {book_key} from index file: {e}.")
+      book_index.pop(book_key, None)
+      return
+
+  logger.info(f"Index saved with {len(book_index)} entries.", extra={"rate_limit": "index.save"})
+
 async def _extract_and_validate_tar(
     temp_tar_path: PyPath, temp_extract_path: PyPath
 ) -> Metadata:
@@ -113,12 +131,14 @@ async def _extract_and_validate_tar(
   await asyncio.to_thread(temp_extract_path.mkdir, parents=True, exist_ok=True)
 
   try:
-    # Perform synchronous tar operations in a thread pool
+    # Perform synchronous tar operations in a thread pool. Phase timings are
+    # collected here and recorded back on the event loop.
+    phase_timings: Dict[str, float] = {}
     def blocking_tar_operations():
-      nonlocal metadata_obj
       has_metadata_file_in_tar = False
       has_chapters_content_in_tar = False
 
+      scan_started = time.perf_counter()
       with tarfile.open(temp_tar_path, 'r:gz') as tar:
         # Check for required files/dirs by inspecting members
         tar_members = tar.getmembers()
@@ -134,10 +154,13 @@ async def _extract_and_validate_tar(
         if not (is_chapters_dir_present or has_files_in_chapters): # chapters/ can be empty but must exist, or contain files
           raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid package: 'chapters/' directory or its content is missing.")
 
+        extract_started = time.perf_counter()
+        phase_timings["tar_scan"] = extract_started - scan_started
+
         # Safe extraction
         for member in tar_members:
           member_destination_path = temp_extract_path / member.name
-          if not _is_within_directory(temp_extract_path, member_destination_path):
+          if not is_within_directory(temp_extract_path, member_destination_path):
             logger.error(f"Path traversal attempt detected in tar member: {member.name}")
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid package: Path traversal detected.")
 
@@ -156,19 +179,25 @@ async def _extract_and_validate_tar(
               shutil.copyfileobj(source, target)
           else:
             logger.warning(f"Skipping non-file/non-dir tar member: {member.name} (type: {member.type})")
-              
-          if not has_metadata_file_in_tar: # Should be caught earlier
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid package: 'metadata.json' failed to extract.")
 
-          metadata_file_path = temp_extract_path / "metadata.json"
-          
-          with open(metadata_file_path, 'r') as f:
-            metadata_data = json.load(f)
-              
-          validated_metadata = Metadata(**metadata_data)
-          return validated_metadata # Return from the synchronous function
+        phase_timings["extract"] = time.perf_counter() - extract_started
+
+        if not has_metadata_file_in_tar: # Should be caught earlier
+          raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid package: 'metadata.json' failed to extract.")
 
-    metadata_obj = await asyncio.to_thread(blocking_tar_operations)
+        metadata_file_path = temp_extract_path / "metadata.json"
+
+        with open(metadata_file_path, 'r') as f:
+          metadata_data = json.load(f)
+
+        validated_metadata = Metadata(**metadata_data)
+        return validated_metadata # Return from the synchronous function
+
+    try:
+      metadata_obj = await asyncio.to_thread(blocking_tar_operations)
+    finally:
+      for phase, seconds in phase_timings.items():
+        UPLOAD_PHASE.observe(seconds, phase)
 
       # Validate metadata (already done by Pydantic in blocking_tar_operations)
       # Validate chapters directory and checksum
@@ -178,12 +207,13 @@ async def _extract_and_validate_tar(
       raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid package: 'chapters/' is not a directory after extraction.")
 
     # Assuming caculate_dir_checksum is a synchronous, potentially blocking function
-    calculated_chapters_checksum = await asyncio.to_thread(
-      calculate_dir_checksum, chapters_dir_actual_path, metadata_obj.checksum_algorithm
-    )
+    with UPLOAD_PHASE.time("chapter_hash"):
+      calculated_chapters_checksum = await asyncio.to_thread(
+        calculate_dir_checksum, chapters_dir_actual_path, metadata_obj.checksum_algorithm
+      )
 
     if calculated_chapters_checksum != metadata_obj.checksum:
-      logger.warning(f"Checksum mismatch for {metadata_obj.name} v{metadata_obj.version}. Expected: {metadata_obj.checksum}, Got: {calculated_chapters_checksum}")
+      logger.warning(f"Checksum mismatch for {metadata_obj.name} v{metadata_obj.version}. Expected: {metadata_obj.checksum}, Got: {calculated_chapters_checksum}", extra={"rate_limit": "upload.checksum"})
       raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Content checksum mismatch. The file may be corrupted or tampered with.")
 
     return metadata_obj
@@ -220,7 +250,7 @@ async def startup_event():
 # The chapters/ directory must contain the book's content.
 # The endpoint validates the package structure, extracts the contents, and calculates checksums.
 # It also checks for path traversal vulnerabilities during extraction.
-# The uploaded book is stored in the BOOKS_DIR directory, and an index entry is created for it.
+# The uploaded book is stored in its BOOKS_DIR shard, and an index entry is created for it.
 # The index is saved to disk asynchronously.
 @books_router.post(
   path='/upload',
@@ -234,149 +264,76 @@ async def upload_book(
   """
   Uploads a book to the server.
   """
+  # Until the index is loaded, the duplicate check below would pass for every
+  # book and saving would overwrite index.json with only the new entry.
+  _require_catalog_ready()
   if not file.filename.endswith('.book') and not file.filename.endswith('.tar.gz'):
     raise HTTPException(status_code=400, detail="Invalid file type. Only .book and .tar.gz files are allowed.")
-  
-  temp_tar_path = os.path.join(TMP_DIR, f"upload_{file.filename}")
-  temp_extract_path = os.path.join(TMP_DIR, f"extract_{file.filename}")
-
-  def cleanup_temp(paths_to_remove: List[str]):
-    for path in paths_to_remove:
-      if os.path.exists(path):
-        if os.path.isdir(path):
-          shutil.rmtree(path)
-        else:
-          os.remove(path)
-    print(f"Cleaned up temporary files: {paths_to_remove}")
 
-  # Ensure cleanup runs even if errors occur mid-processing
-  background_tasks.add_task(cleanup_temp, [temp_tar_path, temp_extract_path])
+  # Unique per request, so concurrent uploads of the same filename don't collide.
+  # The pid lets the temp sweep in `reconcile` tell leftovers of a dead worker.
+  upload_id = f"{os.getpid()}_{uuid.uuid4().hex}"
+  temp_tar_path = _TMP_DIR_PATH / f"upload_{upload_id}.book"
+  temp_extract_path = _TMP_DIR_PATH / f"extract_{upload_id}"
 
-    # --- Save Uploaded File Temporarily ---
-  try:
-    async with aiofiles.open(temp_tar_path, 'wb') as out_file:
-      while content := await file.read(1024 * 1024):
-        await out_file.write(content)
-  except Exception as e:
-    raise HTTPException(status_code=500, detail=f"Error saving file: {e}")
-  finally:
-    await file.close()
-
-  # -- Extract and Validate ---
-  metadata_dict = None
-  caculate_code_checksum = None
   try:
-    with tarfile.open(temp_tar_path, 'r:gz') as tar:
-      for members in tar.getnames():
-        if "metadata.json" not in members:
-          raise HTTPException(status_code=400, detail="Invalid file structure, 'metadata.json' file is required.")
-        elif not any(m.startswith("chapters/") for m in members):
-          raise HTTPException(status_code=400, detail="Invalid file structure, 'chapters/' directory is required.")
-          caculate_code_checksum = caculate_dir_checksum(os.path.join(temp_extract_path, member.name))
-
-      # Extract safely
-      # Warning: tarfile extraction can be vulnerable if paths are absolute or contain '..'
-      # A productoin system might need more robust path checking/santiziation here.
-      def is_with_directory(directory, target):
-        abs_directory = os.path.abspath(directory)
-        abs_target = os.path.abspath(target)
-        prefix = os.path.commonprefix([abs_directory, abs_target])
-        return prefix == abs_directory
-
-      for member in tar.getmembers():
-        member_path = os.path.join(temp_extract_path, member.name)
-        # Prevent path traverals vulnerabilities
-        if not is_with_directory(temp_extract_path, member_path):
-          raise HTTPException(status_code=400, detail="Invalid file structure, path traversal detected.")
-
-        if member.isfile():
-          tar.extract(member, path=temp_extract_path, set_attrs=False)
-        elif member.isdir():
-          tar.extract(member, path=temp_extract_path, set_attrs=False)
-        # Ignore other types like symlinks for simplicity/security here
-
-      # Read metadata
-      metadata_path = os.path.join(temp_extract_path, "metadata.json")
-      if not os.path.exists(metadata_path):
-        raise HTTPException(status_code=400, detail="Invalid file structure, 'metadata.json' file is required.")
-      
-      with open(metadata_path, 'r') as f:
-        metadata_dict = json.load(f)
-
-      # Validate metadata structure
-      try:
-        metadata = Metadata(**metadata_dict)
-      except ValidationError as e:
-        raise HTTPException(status_code=400, detail=f"Invalid metadata structure in 'metadata.json': {e}")
-      
-      # Calculate checksum
-      chapters_dir_path = os.path.join(temp_extract_path, "chapters")
-      if not os.path.isdir(chapters_dir_path):
-        raise HTTPException(status_code=400, detail="Invalid file structure, 'chapters/' directory is required.")
-      
-      caculated_code_checksum = caculate_dir_checksum(chapters_dir_path, metadata.checksum_algorithm)
-
-      # Verify code checksum
-      if caculated_code_checksum != metadata.checksum:
-        raise HTTPException(status_code=400, detail="Checksum mismatch. The file may be corrupted or tampered with.")
-  
-  except tarfile.TarError as e:
-    raise HTTPException(status_code=400, detail=f"Invalid or corrupted book file: {e}")
-  except FileNotFoundError as e:
-    raise HTTPException(status_code=400, detail=f"Missing expected file during extraction/validation: {e}")
-  except HTTPException: # Re-raise HTTP exceptions
-    raise
-  except Exception as e:
-    raise HTTPException(status_code=500, detail=f"Error processing package: {e}")
-  finally:
-    # Cleanup temporary files
-    if os.path.exists(temp_extract_path):
-      try:
-        shutil.rmtree(temp_extract_path)
-      except Exception as e:
-        print(f"Error cleaning up extracted files: {e}")
-
-    # Cleanup temporary tar file
-    if os.path.exists(temp_tar_path):
+    # --- Save Uploaded File Temporarily ---
+    try:
+      with UPLOAD_PHASE.time("spool"):
+        async with aiofiles.open(temp_tar_path, 'wb') as out_file:
+          while content := await file.read(1024 * 1024):
+            await out_file.write(content)
+    except Exception as e:
+      raise HTTPException(status_code=500, detail=f"Error saving file: {e}")
+    finally:
+      await file.close()
+
+    # -- Extract and Validate ---
+    metadata = await _extract_and_validate_tar(temp_tar_path, temp_extract_path)
+
+    # --- Process Valid Book ---
+    book_key = f"{metadata.name}-{metadata.version}"
+    final_book_filename = f"{book_key}.book"
+
+    # Calculate checksum of the *entire* uploaded .book file for download verification
+    with UPLOAD_PHASE.time("book_hash"):
+      book_checksum = await asyncio.to_thread(calculate_sha256, temp_tar_path)
+
+    # Add server-side metadata
+    index_entry = metadata.model_dump(mode="json")
+    index_entry["book_filename"] = final_book_filename
+    index_entry["book_checksum_algo"] = "sha256"
+    index_entry["book_checksum"] = book_checksum
+    index_entry["book_upload_timestamp"] = datetime.datetime.now(tz=datetime.timezone.utc).isoformat()
+
+    async with index_lock:
+      # Books are immutable once uploaded; a new version needs a new version number.
+      if book_key in book_index:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Book already exists.")
+
+      # Move validated package to final destination
       try:
-        os.remove(temp_tar_path)
+        with UPLOAD_PHASE.time("move"):
+          await asyncio.to_thread(book_storage.store, temp_tar_path, final_book_filename)
+      except ValueError as e: # Filename escapes BOOKS_DIR
+        logger.error(f"Refusing to store book {book_key!r}: {e}")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid book name or version.")
       except Exception as e:
-        print(f"Error cleaning up temporary tar file: {e}")
-
-  # --- Process Valid Book ---
-  book_name = metadata.name
-  book_version = metadata.version
-  book_key = f"{book_name}-{book_version}"
+        logger.error(f"Failed to store book file for {book_key}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Failed to store book file: {e}")
 
-  # Calculate checksum of the *entire* uploaded .book file for download verification
-  book_checksum = caculate_sha256(temp_tar_path)
-  final_book_filename = f"{book_key}.book"
-  final_book_path = os.path.join(BOOKS_DIR, final_book_filename)
-
-  # Add server-side metadata
-  index_entry = metadata.model_dump() # Get dict from Pydantic model
-  index_entry["book_filename"] = final_book_filename
-  index_entry["book_checksum_algo"] = "sha256"
-  index_entry["book_checksum"] = book_checksum
-  index_entry["book_upload_timestamp"] = datetime.datetime.now().isoformat()
-
-  async with index_lock:
-    # Check if book already exists
-    if book_key in book_index:
-      # Decide on overwrite behavior - here we prevent it
-      raise HTTPException(status_code=400, detail="Book already exists.")
-    
-    # Move validated package to final destination
-    try:
-      shutil.move(temp_tar_path, final_book_path)
-    except Exception as e:
-      raise HTTPException(status_code=500, detail=f"Failed to store book file: {e}")
-    
-    # Update index in memory
-    book_index[book_key] = index_entry
+      # Update index in memory
+      book_index.add(book_key, index_entry)
 
     # Save index to disk asynchronously
-    await save_index()
+    with UPLOAD_PHASE.time("index_save"):
+      await save_index()
+  except BaseException:
+    # Background tasks only run after a successful response, so clean up here.
+    await _cleanup_temp_paths([temp_tar_path, temp_extract_path])
+    raise
+
+  background_tasks.add_task(_cleanup_temp_paths, [temp_tar_path, temp_extract_path])
 
   return JSONResponse(content={
     "message": "Book uploaded and indexed successfully.",
@@ -390,5 +347,62 @@ async def get_book_index():
   """
   Returns the current book index.
   """
+  _require_catalog_ready()
+  async with index_lock:
+    content = book_index.to_json_bytes()
+  return Response(content=content, media_type="application/json", status_code=200)
+
+@books_router.post("/{book_key}/render", response_model=RenderResponse)
+async def render_book(
+    book_key: str = Path(..., description="Key of the book to render, as '{name}-{version}'"),
+    request: RenderRequest = Body(default_factory=RenderRequest),
+):
+  """
+  Returns the book's chapters rendered as templates against the book's
+  declared variables merged with the values supplied by the agent.
+  """
+  _require_catalog_ready()
+  async with index_lock:
+    record = book_index.get(book_key)
+  if record is None:
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Book '{book_key}' not found.")
+
+  variables = {**(record.to_dict().get("variables") or {}), **request.variables}
+  book_path = await asyncio.to_thread(book_storage.locate, record.filename)
+  if book_path is None:
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Book file for '{book_key}' not found.")
+  variables_hash, chapters = await book_renderer.render(book_key, book_path, variables)
+
+  return JSONResponse(content=RenderResponse(
+    book_key=book_key,
+    book_checksum=record.checksum,
+    variables_hash=variables_hash,
+    variables=variables,
+    chapters=chapters,
+  ).model_dump(mode="json"), status_code=status.HTTP_200_OK)
+
+@books_router.get("/{book_key}/download")
+async def download_book(
+    book_key: str = Path(..., description="Key of the book to download, as '{name}-{version}'"),
+):
+  """
+  Returns the book package. Its checksum is sent in the X-Book-Checksum
+  header as '{algorithm}:{hex digest}' so agents can verify the download.
+  """
+  _require_catalog_ready()
   async with index_lock:
-    return JSONResponse(content=book_index, status_code=200)
\ No newline at end of file
+    record = book_index.get(book_key)
+  if record is None:
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Book '{book_key}' not found.")
+
+  book_path = await asyncio.to_thread(book_storage.locate, record.filename)
+  if book_path is None:
+    logger.error(f"Book {book_key} is indexed but its file {record.filename} is missing.")
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Book file for '{book_key}' not found.")
+
+  return FileResponse(
+    path=book_path,
+    media_type="application/gzip",
+    filename=record.filename,
+    headers={"X-Book-Checksum": f"{record.checksum_algo}:{record.checksum}"},
+  )
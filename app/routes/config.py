@@ -1,8 +1,13 @@
 from fastapi import APIRouter, HTTPException, Path, Query, status
 from fastapi.responses import JSONResponse
-from fastapi import Body
+from fastapi import Body, Depends
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from app.database import get_session
 from app.models.agent import MethodosAgent
+from app.models.sql import Agent
+from app.services.heartbeats import heartbeat_writer
 
 config_router = APIRouter(
     prefix='/config',
@@ -17,14 +22,25 @@ config_router = APIRouter(
     summary="Agent configuration",
     description="Methodos agent configuration endpoint"
 )
-async def agent_configuration(agent: MethodosAgent = Body(...)):
+async def agent_configuration(
+    agent: MethodosAgent = Body(...),
+    session: AsyncSession = Depends(get_session),
+):
     """
     Returns a configuration for a Methodos agent.
     """
     if agent.fqdn == "localhost" or agent.fqdn == "localhost.localdomain":
         raise HTTPException(status_code=404, detail="FQDN cannot be localhost.")
-    
-    # TODO: check if agent is already registered
+
+    # Agents that already checked in were verified then; only hit the
+    # database for the first check-in seen by this worker.
+    if heartbeat_writer.get(agent.uuid) is None:
+        registered = (await session.exec(select(Agent.id).where(Agent.uuid == agent.uuid))).first()
+        if registered is None:
+            raise HTTPException(status_code=404, detail="Agent is not registered.")
+
+    # Buffered in memory; persisted to the agents table by the heartbeat writer.
+    heartbeat_writer.record(agent)
 
     # TODO: From agent type, return configuration
     if agent.type == "host":
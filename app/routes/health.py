@@ -0,0 +1,34 @@
+from fastapi import APIRouter, status
+from fastapi.responses import JSONResponse
+
+from app.routes.books import catalog_ready
+from app.services.reconcile import startup_reconciler
+from app.services.scrubber import integrity_scrubber
+
+health_router = APIRouter(
+  prefix='/health',
+  tags=["Health"],
+)
+
+@health_router.get(
+  path='/',
+  summary="Liveness",
+  description="Reports that the process is up and serving requests."
+)
+async def liveness():
+  return JSONResponse(content={"status": "ok"}, status_code=status.HTTP_200_OK)
+
+@health_router.get(
+  path='/ready',
+  summary="Readiness",
+  description="Reports ready only once the book catalog has been reconciled against BOOKS_DIR."
+)
+async def readiness():
+  if not catalog_ready.is_set():
+    return JSONResponse(content={"status": "starting"}, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+  return JSONResponse(content={
+    "status": "ready",
+    "reconciliation": startup_reconciler.report,
+    "integrity": integrity_scrubber.status(),
+  }, status_code=status.HTTP_200_OK)
@@ -0,0 +1,21 @@
+from fastapi import APIRouter, status
+from fastapi.responses import Response
+
+from app.services.metrics import worker_snapshots
+
+metrics_router = APIRouter(
+  tags=["Metrics"],
+)
+
+@metrics_router.get(
+  path='/metrics',
+  summary="Prometheus metrics",
+  description=(
+    "Metrics of every worker process in the Prometheus text exposition format. "
+    "Each series has a `pid` label naming its worker; aggregate with e.g. "
+    "`sum without (pid) (rate(...))`. Scraping any one worker returns all of them."
+  ),
+  include_in_schema=False,
+)
+async def metrics():
+  return Response(content=await worker_snapshots.render(), media_type="text/plain; version=0.0.4", status_code=status.HTTP_200_OK)
@@ -1,8 +1,14 @@
 from fastapi import APIRouter, HTTPException, Path, Query, status
 from fastapi.responses import JSONResponse
-from fastapi import Body
+from fastapi import Body, Depends
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from app.database import get_session
+from app.enums import State
 from app.models.agent import RegisterAgent
+from app.models.sql import Agent
 
 register_router = APIRouter(
   prefix='/register',
@@ -16,13 +22,31 @@ register_router = APIRouter(
   summary="Register agent",
   description="Register agent endpoint"
 )
-async def register_agent(agent: RegisterAgent = Body(...)):
+async def register_agent(
+  agent: RegisterAgent = Body(...),
+  session: AsyncSession = Depends(get_session),
+):
   if agent.fqdn == "localhost" or agent.fqdn == "localhost.localdomain":
     raise HTTPException(status_code=404, detail="FQDN cannot be localhost.")
-  
-  # TODO: check if agent is already registered
-  
+
+  existing = (await session.exec(select(Agent).where(Agent.uuid == agent.uuid))).first()
+  if existing is not None:
+    raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Agent is already registered.")
+
   # TODO: Generate keypair for agent and save public/private key
+  session.add(Agent(
+    uuid=agent.uuid,
+    fqdn=agent.fqdn,
+    type=agent.type.value,
+    version=agent.version,
+    state=State.UNKNOWN.value,
+  ))
+  try:
+    await session.commit()
+  except IntegrityError:
+    # A concurrent registration of the same uuid committed first.
+    await session.rollback()
+    raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Agent is already registered.")
 
   # TODO: Return registration data
   return JSONResponse(content={
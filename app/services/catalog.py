@@ -0,0 +1,271 @@
+import os
+import sys
+import json
+import mmap
+import tempfile
+import contextlib
+
+from pathlib import Path as PyPath
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+try:
+  import fcntl
+except ImportError: # Windows; saves are only serialized within a process
+  fcntl = None
+
+from app.enums.books import Architecture, Platform
+
+# Bit position of every supported platform and architecture. New enum members
+# must be appended so that existing positions stay stable.
+_PLATFORM_BITS: Dict[str, int] = {member.value: 1 << i for i, member in enumerate(Platform)}
+_ARCHITECTURE_BITS: Dict[str, int] = {member.value: 1 << i for i, member in enumerate(Architecture)}
+
+_Source = Union[mmap.mmap, bytes]
+
+
+def platform_mask(platforms: Iterable[Any]) -> int:
+  """Packs a list of platforms (enum members or their values) into a bitmask."""
+  mask = 0
+  for platform in platforms or ():
+    mask |= _PLATFORM_BITS.get(getattr(platform, "value", platform), 0)
+  return mask
+
+
+def architecture_mask(architectures: Iterable[Any]) -> int:
+  """Packs a list of architectures (enum members or their values) into a bitmask."""
+  mask = 0
+  for architecture in architectures or ():
+    mask |= _ARCHITECTURE_BITS.get(getattr(architecture, "value", architecture), 0)
+  return mask
+
+
+class CatalogRecord:
+  """
+  Compact in-memory form of one index entry.
+
+  Only the fields needed on hot paths are kept as attributes. The full entry
+  (description, variables, dependencies, ...) stays as serialized JSON, either
+  in the memory-mapped index file or, until the next save, in a bytes buffer.
+  It is only parsed when asked for.
+  """
+  __slots__ = ("key", "name", "version", "filename", "checksum", "checksum_algo", "platforms", "architectures", "_cold")
+
+  def __init__(self, key: str, entry: Dict[str, Any], cold: Tuple[_Source, int, int]):
+    self.key = key
+    self.name = sys.intern(entry["name"])
+    self.version = sys.intern(entry["version"])
+    self.filename = entry["book_filename"]
+    self.checksum = entry["book_checksum"]
+    self.checksum_algo = sys.intern(entry.get("book_checksum_algo", "sha256"))
+    self.platforms = platform_mask(entry.get("supported_platforms"))
+    self.architectures = architecture_mask(entry.get("supported_architectures"))
+    # (source, offset, length), replaced as a whole so readers never see a torn update.
+    self._cold = cold
+
+  def supports(self, platform: Any = None, architecture: Any = None) -> bool:
+    if platform is not None and not self.platforms & platform_mask((platform,)):
+      return False
+    if architecture is not None and not self.architectures & architecture_mask((architecture,)):
+      return False
+    return True
+
+  def raw(self) -> bytes:
+    """The full entry as serialized JSON."""
+    source, offset, length = self._cold
+    return source[offset:offset + length]
+
+  def to_dict(self) -> Dict[str, Any]:
+    """The full entry, parsed from its serialized form."""
+    return json.loads(self.raw())
+
+
+class Catalog:
+  """
+  The book index, keyed by book key, holding `CatalogRecord`s.
+
+  On disk the index stays a JSON object, written with one entry per line so
+  the byte range of every entry is known. The file is memory-mapped after
+  loading and after every save; since every worker maps the same file, the
+  cold part of the catalog lives once in the page cache rather than once per
+  worker as Python dicts. Saves replace the file atomically, so a mapping held
+  by this or another worker is never truncated underneath it.
+  """
+
+  def __init__(self):
+    self._records: Dict[str, CatalogRecord] = {}
+    self._mm: Optional[mmap.mmap] = None
+
+  def __len__(self) -> int:
+    return len(self._records)
+
+  def __contains__(self, book_key: object) -> bool:
+    return book_key in self._records
+
+  def __iter__(self) -> Iterator[str]:
+    return iter(self._records)
+
+  def get(self, book_key: str) -> Optional[CatalogRecord]:
+    return self._records.get(book_key)
+
+  def keys(self):
+    return self._records.keys()
+
+  def values(self):
+    return self._records.values()
+
+  def items(self):
+    return self._records.items()
+
+  def add(self, book_key: str, entry: Dict[str, Any]) -> CatalogRecord:
+    """Adds an entry. Its full form is kept in memory until the next save."""
+    raw = json.dumps(entry, separators=(",", ":"), default=str).encode("utf-8")
+    record = CatalogRecord(book_key, entry, (raw, 0, len(raw)))
+    self._records[book_key] = record
+    return record
+
+  def pop(self, book_key: str, default: Any = None) -> Optional[CatalogRecord]:
+    return self._records.pop(book_key, default)
+
+  def clear(self) -> None:
+    self._records.clear()
+    self._mm = None
+
+  def to_json_bytes(self) -> bytes:
+    """The whole index as a JSON object, assembled without parsing any entry."""
+    parts: List[bytes] = []
+    for book_key, record in self._records.items():
+      parts.append(json.dumps(book_key).encode("utf-8") + b":" + record.raw())
+    return b"{" + b",".join(parts) + b"}"
+
+  def load(self, path: Union[str, PyPath]) -> None:
+    """
+    Replaces the contents with the index file at `path`. Blocking.
+    Index files in any other JSON layout are read in full and rewritten.
+    """
+    if self._load(path):
+      self.save(path)
+
+  def _load(self, path: Union[str, PyPath]) -> bool:
+    """Loads `path`; returns whether it has to be rewritten in the line layout."""
+    self.clear()
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+      return False
+
+    with open(path, "rb") as f:
+      mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    spans = _line_spans(mm)
+    if spans is None:
+      # Not written by `save` (e.g. an older pretty-printed index).
+      for book_key, entry in json.loads(mm[:]).items():
+        self.add(book_key, entry)
+      mm.close()
+      return True
+
+    for book_key, offset, length in spans:
+      entry = json.loads(mm[offset:offset + length])
+      self._records[book_key] = CatalogRecord(book_key, entry, (mm, offset, length))
+    self._mm = mm
+    return False
+
+  def remove_saved(self, path: Union[str, PyPath], book_key: str) -> Optional[CatalogRecord]:
+    """
+    Removes an entry from the index file at `path` and from this catalog. Blocking.
+    The file is reloaded under `index_file_lock` first, so entries saved by
+    other processes since this catalog was loaded are kept, not overwritten.
+    """
+    current = Catalog()
+    with index_file_lock(path):
+      current._load(path)
+      record = current._records.pop(book_key, None)
+      current._write(path)
+    # Swapped in only once the file is saved; on error this catalog is unchanged.
+    self._records, self._mm = current._records, current._mm
+    return record
+
+  def save(self, path: Union[str, PyPath]) -> None:
+    """
+    Writes the index to `path` atomically and remaps it. Blocking.
+    Saves from other processes are serialized by `index_file_lock`.
+    """
+    with index_file_lock(path):
+      self._write(path)
+
+  def _write(self, path: Union[str, PyPath]) -> None:
+    # A temp file of our own, so concurrent writers never share one.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=f"{os.path.basename(path)}.", suffix=".tmp")
+    spans: List[Tuple[CatalogRecord, int, int]] = []
+    try:
+      with os.fdopen(fd, "wb") as f:
+        f.write(b"{\n")
+        last = len(self._records) - 1
+        for i, (book_key, record) in enumerate(self._records.items()):
+          prefix = json.dumps(book_key).encode("utf-8") + b": "
+          raw = record.raw()
+          offset = f.tell() + len(prefix)
+          f.write(prefix + raw + (b",\n" if i < last else b"\n"))
+          spans.append((record, offset, len(raw)))
+        f.write(b"}\n")
+        f.flush()
+        os.fsync(f.fileno())
+      os.chmod(tmp_path, 0o644)
+      os.replace(tmp_path, path)
+    except BaseException:
+      try:
+        os.remove(tmp_path)
+      except FileNotFoundError:
+        pass
+      raise
+
+    with open(path, "rb") as f:
+      mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    for record, offset, length in spans:
+      record._cold = (mm, offset, length)
+    # The previous mapping is released once no reader holds a record pointing at it.
+    self._mm = mm
+
+
+@contextlib.contextmanager
+def index_file_lock(path: Union[str, PyPath]) -> Iterator[None]:
+  """
+  Holds an exclusive lock on `<path>.lock` across processes. Blocking.
+  The lock is taken on a separate file because `path` itself is replaced on save.
+  """
+  if fcntl is None:
+    yield
+    return
+  with open(f"{path}.lock", "a") as lock_file:
+    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+    try:
+      yield
+    finally:
+      fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _line_spans(mm: mmap.mmap) -> Optional[List[Tuple[str, int, int]]]:
+  """
+  Returns (book_key, offset, length) of each entry's value in an index file
+  written by `Catalog.save`, or None if the file has a different layout.
+  """
+  decoder = json.JSONDecoder()
+  spans: List[Tuple[str, int, int]] = []
+  if mm.readline() != b"{\n":
+    return None
+  while True:
+    start = mm.tell()
+    line = mm.readline()
+    if line == b"}\n" or line == b"}":
+      return spans
+    if not line.endswith(b"\n"):
+      return None
+    text = line.decode("utf-8")
+    try:
+      book_key, end = decoder.raw_decode(text)
+    except json.JSONDecodeError:
+      return None
+    if not isinstance(book_key, str) or text[end:end + 2] != ": ":
+      return None
+    # Keys are the only part that may contain multi-byte characters before the value.
+    value_start = start + len(text[:end + 2].encode("utf-8"))
+    value_end = start + len(line) - (2 if line.endswith(b",\n") else 1)
+    spans.append((book_key, value_start, value_end - value_start))
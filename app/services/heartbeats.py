@@ -0,0 +1,196 @@
+import os
+import asyncio
+import datetime
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from uuid import UUID
+
+import pytz
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import logger
+from app.database import engine
+from app.models.agent import MethodosAgent
+from app.models.sql import Agent
+from app.services.metrics import registry
+
+HEARTBEAT_FLUSH_INTERVAL: float = float(os.getenv("HEARTBEAT_FLUSH_INTERVAL", "5.0"))
+HEARTBEAT_BATCH_SIZE: int = int(os.getenv("HEARTBEAT_BATCH_SIZE", "500"))
+HEARTBEAT_MAX_PENDING: int = int(os.getenv("HEARTBEAT_MAX_PENDING", "100000"))
+
+# Columns refreshed on every check-in. Keys are left untouched so that an
+# agent's registration data is never clobbered by a heartbeat.
+_HEARTBEAT_COLUMNS = ("fqdn", "type", "state", "mode", "version", "uptime", "last_seen")
+
+
+@dataclass(frozen=True)
+class AgentHeartbeat:
+  """Latest reported state of an agent, as seen on its last check-in."""
+  uuid: UUID
+  fqdn: str
+  type: str
+  state: str
+  mode: str
+  version: str
+  uptime: int
+  last_seen: datetime.datetime
+
+  @classmethod
+  def from_agent(cls, agent: MethodosAgent) -> "AgentHeartbeat":
+    return cls(
+      uuid=agent.uuid,
+      fqdn=agent.fqdn,
+      type=agent.type.value,
+      state=agent.state.value,
+      mode=agent.mode.value,
+      version=agent.version,
+      uptime=agent.uptime,
+      last_seen=datetime.datetime.now(tz=pytz.UTC),
+    )
+
+
+class HeartbeatWriter:
+  """
+  Write-behind buffer for agent check-ins.
+
+  `record` only touches in-memory state and never awaits, so it is safe to
+  call from request handlers. A background task periodically drains the
+  pending changes and writes them to the `agents` table as batched upserts.
+  Repeated check-ins from the same agent between flushes coalesce into one row.
+  """
+
+  def __init__(
+    self,
+    flush_interval: float = HEARTBEAT_FLUSH_INTERVAL,
+    batch_size: int = HEARTBEAT_BATCH_SIZE,
+    max_pending: int = HEARTBEAT_MAX_PENDING,
+  ):
+    self.flush_interval = flush_interval
+    self.batch_size = batch_size
+    self.max_pending = max_pending
+
+    self._latest: Dict[UUID, AgentHeartbeat] = {}
+    self._pending: Dict[UUID, AgentHeartbeat] = {}
+    self._wakeup = asyncio.Event()
+    self._task: Optional[asyncio.Task] = None
+    self._stopping = False
+    self.dropped: int = 0
+
+  def record(self, agent: MethodosAgent) -> None:
+    """Records a check-in. Cheap and non-blocking."""
+    heartbeat = AgentHeartbeat.from_agent(agent)
+
+    self._latest[heartbeat.uuid] = heartbeat
+
+    if heartbeat.uuid not in self._pending and len(self._pending) >= self.max_pending:
+      # The flusher is falling behind. Keep the write buffer bounded by refusing
+      # new agents; agents already pending still have their entry updated.
+      self.dropped += 1
+      self._wakeup.set()
+      return
+
+    self._pending[heartbeat.uuid] = heartbeat
+
+    if len(self._pending) >= self.batch_size:
+      self._wakeup.set()
+
+  def get(self, uuid: UUID) -> Optional[AgentHeartbeat]:
+    """Returns the latest known state of an agent, if it has checked in."""
+    return self._latest.get(uuid)
+
+  def snapshot(self) -> List[AgentHeartbeat]:
+    """Returns the latest known state of every agent that has checked in."""
+    return list(self._latest.values())
+
+  @property
+  def pending(self) -> int:
+    return len(self._pending)
+
+  def start(self) -> None:
+    """Starts the background flush task on the running event loop."""
+    if self._task is None or self._task.done():
+      self._stopping = False
+      self._task = asyncio.create_task(self._run(), name="heartbeat-writer")
+      logger.info(f"Heartbeat writer started (interval={self.flush_interval}s, batch={self.batch_size}, max_pending={self.max_pending}).")
+
+  async def stop(self) -> None:
+    """Stops the background task and flushes whatever is still pending."""
+    # Let the task finish its current flush rather than cancelling it mid-write.
+    self._stopping = True
+    self._wakeup.set()
+    if self._task is not None:
+      await self._task
+      self._task = None
+    try:
+      await self.flush()
+    except Exception:
+      logger.critical(f"{self.pending} agent heartbeats could not be persisted on shutdown.")
+    logger.info(f"Heartbeat writer stopped ({self.dropped} check-ins dropped).")
+
+  async def flush(self) -> int:
+    """Writes all pending check-ins to the database. Returns the number of rows written."""
+    if not self._pending:
+      return 0
+
+    batch, self._pending = self._pending, {}
+    rows = list(batch.values())
+    try:
+      for start in range(0, len(rows), self.batch_size):
+        await _upsert_heartbeats(rows[start:start + self.batch_size])
+    except Exception as e:
+      logger.error(f"Error flushing {len(rows)} agent heartbeats: {e}", exc_info=True)
+      # Put the batch back without overwriting anything newer that arrived meanwhile.
+      for uuid, heartbeat in batch.items():
+        self._pending.setdefault(uuid, heartbeat)
+      raise
+    return len(rows)
+
+  async def _run(self) -> None:
+    while not self._stopping:
+      try:
+        await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+      except asyncio.TimeoutError:
+        pass
+      self._wakeup.clear()
+      try:
+        await self.flush()
+      except Exception:
+        # Already logged; retry on the next tick.
+        pass
+
+
+async def _upsert_heartbeats(rows: List[AgentHeartbeat]) -> None:
+  """Inserts or updates a batch of agents keyed on uuid, in a single statement."""
+  table = Agent.__table__
+  dialect = engine.dialect.name
+  if dialect == "postgresql":
+    insert = postgresql.insert
+  elif dialect == "sqlite":
+    insert = sqlite.insert
+  else:
+    raise NotImplementedError(f"Heartbeat upserts are not supported on '{dialect}'.")
+
+  stmt = insert(table).values([
+    {column: getattr(row, column) for column in ("uuid",) + _HEARTBEAT_COLUMNS}
+    for row in rows
+  ])
+  stmt = stmt.on_conflict_do_update(
+    index_elements=[table.c.uuid],
+    set_={column: stmt.excluded[column] for column in _HEARTBEAT_COLUMNS},
+  )
+  async with engine.begin() as connection:
+    await connection.execute(stmt)
+
+
+heartbeat_writer = HeartbeatWriter()
+
+registry.counter(
+  "methodos_heartbeats_dropped_total", "Check-ins from new agents refused because the heartbeat buffer was full.",
+  callback=lambda: heartbeat_writer.dropped,
+)
+registry.gauge(
+  "methodos_heartbeats_pending", "Agents with a check-in waiting to be written to the database.",
+  callback=lambda: heartbeat_writer.pending,
+)
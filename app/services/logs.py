@@ -0,0 +1,197 @@
+import os
+import sys
+import json
+import time
+import queue
+import random
+import atexit
+import logging
+import datetime
+import contextvars
+import logging.handlers
+
+from typing import Dict, List, Optional, Tuple
+
+LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json").lower()
+LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Records per second allowed for each rate-limited message, e.g. per-upload cleanup logs.
+LOG_RATE_LIMIT: float = float(os.getenv("LOG_RATE_LIMIT", "5"))
+# Comma-separated path prefixes and the fraction of INFO/DEBUG records kept for
+# requests under them, e.g. "/config=0.01,/books/index=0.1". Warnings always pass.
+LOG_SAMPLE_RATES: str = os.getenv("LOG_SAMPLE_RATES", "")
+
+# Method and path of the request being handled, for sampling and as record fields.
+request_context: contextvars.ContextVar[Optional[Tuple[str, str]]] = contextvars.ContextVar("request_context", default=None)
+
+# Attributes every LogRecord has; anything else was passed through `extra`.
+_STANDARD_ATTRS = set(logging.LogRecord("", 0, "", 0, "", None, None).__dict__) | {"message", "asctime"}
+
+
+def _parse_sample_rates(spec: str) -> List[Tuple[str, float]]:
+  rates = []
+  for item in filter(None, (part.strip() for part in spec.split(","))):
+    prefix, _, rate = item.partition("=")
+    rates.append((prefix.strip(), float(rate)))
+  # Longest prefix wins.
+  return sorted(rates, key=lambda pair: len(pair[0]), reverse=True)
+
+
+class RouteSamplingFilter(logging.Filter):
+  """Keeps only a fraction of INFO and DEBUG records emitted while handling requests to noisy routes."""
+
+  def __init__(self, rates: List[Tuple[str, float]]):
+    super().__init__()
+    self.rates = rates
+
+  def filter(self, record: logging.LogRecord) -> bool:
+    if record.levelno >= logging.WARNING or not self.rates:
+      return True
+    context = request_context.get()
+    if context is None:
+      return True
+    path = context[1]
+    for prefix, rate in self.rates:
+      if path.startswith(prefix):
+        return rate >= 1.0 or random.random() < rate
+    return True
+
+
+class RateLimitFilter(logging.Filter):
+  """
+  Token bucket per message key, applied to records logged with
+  `extra={"rate_limit": "<key>"}`. Suppressed records are counted, and the
+  count is attached to the next record that gets through as `suppressed`.
+  """
+
+  def __init__(self, rate: float):
+    super().__init__()
+    self.rate = rate
+    self._buckets: Dict[str, List[float]] = {} # key -> [tokens, last refill, suppressed]
+    self.suppressed = 0
+
+  def filter(self, record: logging.LogRecord) -> bool:
+    key = getattr(record, "rate_limit", None)
+    if key is None or self.rate <= 0:
+      return True
+    now = time.monotonic()
+    bucket = self._buckets.get(key)
+    if bucket is None:
+      bucket = self._buckets[key] = [self.rate, now, 0]
+    bucket[0] = min(self.rate, bucket[0] + (now - bucket[1]) * self.rate)
+    bucket[1] = now
+    if bucket[0] < 1:
+      bucket[2] += 1
+      self.suppressed += 1
+      return False
+    bucket[0] -= 1
+    if bucket[2]:
+      record.suppressed = int(bucket[2])
+      bucket[2] = 0
+    return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+  """
+  Hands records to a bounded queue drained by a background thread. When the
+  queue is full the record is dropped and counted instead of blocking the
+  caller, which is usually the event loop.
+  """
+
+  def __init__(self, log_queue: "queue.Queue[logging.LogRecord]"):
+    super().__init__(log_queue)
+    self.dropped = 0
+
+  def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+    # Resolve everything that depends on the caller's state (arguments,
+    # traceback, request context) here; formatting happens in the writer thread.
+    record.message = record.getMessage()
+    record.msg, record.args = record.message, None
+    if record.exc_info:
+      record.exc_text = logging.Formatter().formatException(record.exc_info)
+      record.exc_info = None
+    context = request_context.get()
+    if context is not None:
+      record.method, record.path = context
+    return record
+
+  def enqueue(self, record: logging.LogRecord) -> None:
+    try:
+      self.queue.put_nowait(record)
+    except queue.Full:
+      self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+  """One JSON object per line, with `extra` fields included as top-level keys."""
+
+  def format(self, record: logging.LogRecord) -> str:
+    payload = {
+      "time": datetime.datetime.fromtimestamp(record.created, tz=datetime.timezone.utc).isoformat(),
+      "level": record.levelname,
+      "logger": record.name,
+      "message": record.getMessage(),
+    }
+    for key, value in record.__dict__.items():
+      if key not in _STANDARD_ATTRS and key not in payload:
+        payload[key] = value
+    if record.exc_text:
+      payload["exception"] = record.exc_text
+    return json.dumps(payload, default=str)
+
+
+class LogContextMiddleware:
+  """ASGI middleware exposing the current request's method and path to log records."""
+
+  def __init__(self, app):
+    self.app = app
+
+  async def __call__(self, scope, receive, send):
+    if scope["type"] != "http":
+      await self.app(scope, receive, send)
+      return
+    token = request_context.set((scope["method"], scope["path"]))
+    try:
+      await self.app(scope, receive, send)
+    finally:
+      request_context.reset(token)
+
+
+queue_handler: Optional[DroppingQueueHandler] = None
+rate_limit_filter: Optional[RateLimitFilter] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging(logger: logging.Logger) -> None:
+  """Routes `logger` through the non-blocking queue handler. Safe to call more than once."""
+  global queue_handler, rate_limit_filter, _listener
+  logger.setLevel(LOG_LEVEL)
+  logger.propagate = False
+  if queue_handler is not None:
+    if queue_handler not in logger.handlers:
+      logger.addHandler(queue_handler)
+    return
+
+  writer = logging.StreamHandler(sys.stderr)
+  if LOG_FORMAT == "json":
+    writer.setFormatter(JsonFormatter())
+  else:
+    writer.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+  rate_limit_filter = RateLimitFilter(LOG_RATE_LIMIT)
+  queue_handler = DroppingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+  queue_handler.addFilter(RouteSamplingFilter(_parse_sample_rates(LOG_SAMPLE_RATES)))
+  queue_handler.addFilter(rate_limit_filter)
+  logger.addHandler(queue_handler)
+
+  _listener = logging.handlers.QueueListener(queue_handler.queue, writer, respect_handler_level=True)
+  _listener.start()
+  atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+  """Writes out whatever is still queued and stops the writer thread."""
+  global _listener
+  if _listener is not None:
+    _listener.stop()
+    _listener = None
@@ -0,0 +1,386 @@
+import os
+import json
+import time
+import asyncio
+
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path as PyPath
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app import METRICS_DIR, logger, pid_alive
+from app.services import logs
+
+# How often each worker publishes its samples to METRICS_DIR for the others to serve.
+METRICS_SNAPSHOT_INTERVAL: float = float(os.getenv("METRICS_SNAPSHOT_INTERVAL", "5.0"))
+
+# Latency buckets in seconds, from sub-millisecond lock waits to slow uploads.
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+  0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+_LabelValues = Tuple[str, ...]
+
+
+def _format_labels(worker: str, names: Sequence[str], values: _LabelValues, extra: str = "") -> str:
+  pairs = [worker] + [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+  if extra:
+    pairs.append(extra)
+  return "{" + ",".join(pairs) + "}"
+
+
+def _worker_label() -> str:
+  # Read at collection time; a pre-forking server may import this module before forking.
+  return f'pid="{os.getpid()}"'
+
+
+def _escape(value: str) -> str:
+  return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+  return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+  kind = "untyped"
+
+  def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+    self.name = name
+    self.documentation = documentation
+    self.labelnames = tuple(labelnames)
+
+  def header(self) -> List[str]:
+    return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+  """
+  Monotonically increasing value. Increments are plain dict updates on the
+  event loop; a total kept elsewhere can instead be read from a callback.
+  """
+  kind = "counter"
+
+  def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), callback: Optional[Callable[[], float]] = None):
+    super().__init__(name, documentation, labelnames)
+    self._values: Dict[_LabelValues, float] = {}
+    self.callback = callback
+
+  def inc(self, *labels: str, amount: float = 1.0) -> None:
+    self._values[labels] = self._values.get(labels, 0.0) + amount
+
+  def collect(self, worker: str) -> List[str]:
+    if self.callback is not None:
+      try:
+        return [f"{self.name}{{{worker}}} {_format_value(self.callback())}"]
+      except Exception:
+        return []
+    return [f"{self.name}{_format_labels(worker, self.labelnames, labels)} {_format_value(value)}" for labels, value in self._values.items()]
+
+
+class Gauge(_Metric):
+  """Point-in-time value, either set directly or read from a callback at scrape time."""
+  kind = "gauge"
+
+  def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), callback: Optional[Callable[[], float]] = None):
+    super().__init__(name, documentation, labelnames)
+    self._values: Dict[_LabelValues, float] = {}
+    self.callback = callback
+
+  def set(self, value: float, *labels: str) -> None:
+    self._values[labels] = value
+
+  def collect(self, worker: str) -> List[str]:
+    if self.callback is not None:
+      try:
+        return [f"{self.name}{{{worker}}} {_format_value(self.callback())}"]
+      except Exception:
+        return []
+    return [f"{self.name}{_format_labels(worker, self.labelnames, labels)} {_format_value(value)}" for labels, value in self._values.items()]
+
+
+class Histogram(_Metric):
+  """
+  Cumulative histogram with fixed buckets. An observation is one bisect and
+  three additions, so it is cheap enough to leave on for every request.
+  """
+  kind = "histogram"
+
+  def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+    super().__init__(name, documentation, labelnames)
+    self.buckets = tuple(sorted(buckets))
+    # labels -> [per-bucket counts..., +Inf count, sum]
+    self._series: Dict[_LabelValues, List[float]] = {}
+
+  def observe(self, value: float, *labels: str) -> None:
+    series = self._series.get(labels)
+    if series is None:
+      series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+    series[bisect_left(self.buckets, value)] += 1
+    series[-1] += value
+
+  def time(self, *labels: str) -> "_Timer":
+    """Context manager observing the duration of its block."""
+    return _Timer(self, labels)
+
+  def collect(self, worker: str) -> List[str]:
+    lines = []
+    for labels, series in self._series.items():
+      cumulative = 0
+      for bound, count in zip(self.buckets + (float("inf"),), series):
+        cumulative += count
+        le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+        lines.append(f"{self.name}_bucket{_format_labels(worker, self.labelnames, labels, le)} {cumulative}")
+      lines.append(f"{self.name}_sum{_format_labels(worker, self.labelnames, labels)} {_format_value(series[-1])}")
+      lines.append(f"{self.name}_count{_format_labels(worker, self.labelnames, labels)} {cumulative}")
+    return lines
+
+
+class _Timer:
+  __slots__ = ("histogram", "labels", "started")
+
+  def __init__(self, histogram: Histogram, labels: _LabelValues):
+    self.histogram = histogram
+    self.labels = labels
+
+  def __enter__(self):
+    self.started = time.perf_counter()
+    return self
+
+  def __exit__(self, *exc):
+    self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+    return False
+
+
+class Registry:
+  """
+  Holds the process's metrics and renders them in the Prometheus text format.
+  Every series carries a `pid` label, so the series of different worker
+  processes never overwrite each other; see `WorkerSnapshots`.
+  """
+
+  def __init__(self):
+    self._metrics: Dict[str, _Metric] = {}
+
+  def register(self, metric: _Metric) -> _Metric:
+    self._metrics[metric.name] = metric
+    return metric
+
+  def counter(self, name: str, documentation: str, labelnames: Sequence[str] = (), callback: Optional[Callable[[], float]] = None) -> Counter:
+    return self.register(Counter(name, documentation, labelnames, callback))
+
+  def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (), callback: Optional[Callable[[], float]] = None) -> Gauge:
+    return self.register(Gauge(name, documentation, labelnames, callback))
+
+  def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return self.register(Histogram(name, documentation, labelnames, buckets))
+
+  def samples(self) -> Dict[str, List[str]]:
+    """This process's sample lines, by metric name."""
+    worker = _worker_label()
+    return {name: metric.collect(worker) for name, metric in self._metrics.items()}
+
+  def render(self, peers: Iterable[Dict[str, List[str]]] = ()) -> str:
+    """Renders this process's metrics followed, per metric, by the samples of `peers`."""
+    peers = list(peers)
+    lines: List[str] = []
+    for name, samples in self.samples().items():
+      lines.extend(self._metrics[name].header())
+      lines.extend(samples)
+      for peer in peers:
+        lines.extend(peer.get(name, ()))
+    return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_LATENCY = registry.histogram(
+  "methodos_http_request_duration_seconds", "HTTP request latency by route.", ("method", "route", "status"),
+)
+RESPONSE_BYTES = registry.counter(
+  "methodos_http_response_bytes_total", "Bytes sent in HTTP response bodies by route.", ("route",),
+)
+UPLOAD_PHASE = registry.histogram(
+  "methodos_upload_phase_seconds", "Time spent in each phase of a book upload.", ("phase",),
+)
+LOCK_WAIT = registry.histogram(
+  "methodos_lock_wait_seconds", "Time spent waiting to acquire a lock.", ("lock",),
+)
+LOCK_HOLD = registry.histogram(
+  "methodos_lock_hold_seconds", "Time a lock was held.", ("lock",),
+)
+
+
+class TimedLock:
+  """An asyncio.Lock that records wait and hold times under the given name."""
+
+  def __init__(self, name: str):
+    self.name = name
+    self._lock = asyncio.Lock()
+    self._acquired_at = 0.0
+
+  def locked(self) -> bool:
+    return self._lock.locked()
+
+  async def __aenter__(self):
+    started = time.perf_counter()
+    await self._lock.acquire()
+    self._acquired_at = time.perf_counter()
+    LOCK_WAIT.observe(self._acquired_at - started, self.name)
+    return self
+
+  async def __aexit__(self, *exc):
+    LOCK_HOLD.observe(time.perf_counter() - self._acquired_at, self.name)
+    self._lock.release()
+    return False
+
+
+class MetricsMiddleware:
+  """
+  ASGI middleware recording latency and response size per route template
+  (e.g. '/books/{book_key}/download'), so label cardinality stays bounded.
+  """
+
+  def __init__(self, app):
+    self.app = app
+
+  async def __call__(self, scope, receive, send):
+    if scope["type"] != "http":
+      await self.app(scope, receive, send)
+      return
+
+    started = time.perf_counter()
+    status_code = 500
+    sent = 0
+
+    async def send_wrapper(message):
+      nonlocal status_code, sent
+      if message["type"] == "http.response.start":
+        status_code = message["status"]
+      elif message["type"] == "http.response.body":
+        sent += len(message.get("body", b""))
+      await send(message)
+
+    try:
+      await self.app(scope, receive, send_wrapper)
+    finally:
+      route = scope.get("route")
+      route_path = getattr(route, "path", "unmatched")
+      REQUEST_LATENCY.observe(time.perf_counter() - started, scope["method"], route_path, str(status_code))
+      RESPONSE_BYTES.inc(route_path, amount=sent)
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+def _thread_pool_queue_depth() -> float:
+  # The work queue is not public API, but it is the only place the backlog is visible.
+  return _executor._work_queue.qsize() if _executor is not None else 0
+
+THREAD_POOL_QUEUE = registry.gauge(
+  "methodos_thread_pool_queue_depth", "Tasks waiting for a thread in the default executor (asyncio.to_thread).",
+  callback=_thread_pool_queue_depth,
+)
+
+registry.counter(
+  "methodos_log_records_dropped_total", "Log records dropped because the log queue was full.",
+  callback=lambda: logs.queue_handler.dropped if logs.queue_handler is not None else 0,
+)
+registry.counter(
+  "methodos_log_records_suppressed_total", "Log records suppressed by per-message rate limits.",
+  callback=lambda: logs.rate_limit_filter.suppressed if logs.rate_limit_filter is not None else 0,
+)
+
+def instrument_default_executor() -> None:
+  """Installs a default executor on the running loop whose queue depth is exported."""
+  global _executor
+  _executor = ThreadPoolExecutor(thread_name_prefix="methodos-worker")
+  asyncio.get_running_loop().set_default_executor(_executor)
+
+
+class WorkerSnapshots:
+  """
+  Shares every worker's samples through a directory, so that a scrape served
+  by any one worker returns the series of all of them.
+
+  Each worker writes its samples to `<pid>.json` every `interval` seconds and
+  whenever it is scraped. Files of workers that have exited, or that have not
+  been refreshed for a few intervals, are left out, and removed once their
+  worker is gone. With no directory configured only this worker is served.
+  """
+
+  def __init__(self, directory: str = METRICS_DIR, interval: float = METRICS_SNAPSHOT_INTERVAL):
+    self.directory = PyPath(directory).resolve(strict=False) if directory else None
+    self.interval = interval
+    self._task: Optional[asyncio.Task] = None
+
+  def start(self) -> None:
+    if self.directory is not None and self._task is None:
+      self._task = asyncio.create_task(self._run(), name="metrics-snapshots")
+
+  async def stop(self) -> None:
+    if self._task is not None:
+      self._task.cancel()
+      try:
+        await self._task
+      except asyncio.CancelledError:
+        pass
+      self._task = None
+    if self.directory is not None:
+      try:
+        await asyncio.to_thread(os.remove, self._path(os.getpid()))
+      except FileNotFoundError:
+        pass
+
+  async def render(self) -> str:
+    """This worker's metrics and the latest snapshot of every other live worker."""
+    if self.directory is None:
+      return registry.render()
+    try:
+      peers = await asyncio.to_thread(self._exchange, registry.samples())
+    except (OSError, ValueError) as e:
+      logger.error(f"Error reading worker metrics from {self.directory}: {e}")
+      peers = []
+    return registry.render(peers)
+
+  async def _run(self) -> None:
+    while True:
+      try:
+        await asyncio.to_thread(self._write, registry.samples())
+      except OSError as e:
+        logger.error(f"Error writing worker metrics to {self.directory}: {e}", extra={"rate_limit": "metrics.snapshot"})
+      await asyncio.sleep(self.interval)
+
+  def _path(self, pid: int) -> PyPath:
+    return self.directory / f"{pid}.json"
+
+  def _write(self, samples: Dict[str, List[str]]) -> None:
+    self.directory.mkdir(parents=True, exist_ok=True)
+    path = self._path(os.getpid())
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+      json.dump(samples, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+  def _exchange(self, samples: Dict[str, List[str]]) -> List[Dict[str, List[str]]]:
+    """Writes this worker's samples and reads every other worker's. Blocking."""
+    self._write(samples)
+    peers = []
+    oldest = time.time() - 3 * self.interval
+    for entry in os.scandir(self.directory):
+      pid, _, suffix = entry.name.partition(".")
+      if suffix != "json" or not pid.isdigit() or int(pid) == os.getpid():
+        continue
+      try:
+        if not pid_alive(int(pid)):
+          os.remove(entry.path)
+          continue
+        if entry.stat().st_mtime < oldest:
+          continue
+        with open(entry.path) as f:
+          peers.append(json.load(f))
+      except (FileNotFoundError, ValueError):
+        continue
+    return peers
+
+
+worker_snapshots = WorkerSnapshots()
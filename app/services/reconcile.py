@@ -0,0 +1,176 @@
+import os
+import re
+import time
+import shutil
+import asyncio
+
+from pathlib import Path as PyPath
+from typing import Dict, List, Optional
+
+from app import logger, TMP_DIR, pid_alive
+from app.routes.books import book_index, index_lock, catalog_ready, load_index, save_index
+from app.services.scrubber import FileFingerprint, integrity_scrubber
+from app.services.storage import book_storage
+
+# Temp files younger than this may belong to an upload in progress in another worker.
+# Files whose owning worker is known to have exited are swept regardless of age.
+TMP_SWEEP_MIN_AGE: float = float(os.getenv("TMP_SWEEP_MIN_AGE", "3600"))
+TMP_SWEEP_INTERVAL: float = float(os.getenv("TMP_SWEEP_INTERVAL", "600"))
+_TMP_PREFIXES = ("upload_", "extract_")
+# upload_<pid>_<id>.book and extract_<pid>_<id>, as named by `upload_book`.
+_TMP_OWNER = re.compile(r"^(?:upload|extract)_(\d+)_")
+
+
+def _scan_dir(path: PyPath) -> Dict[str, os.stat_result]:
+  """Lists a directory with one stat per entry. Missing directories scan as empty. Blocking."""
+  entries: Dict[str, os.stat_result] = {}
+  try:
+    with os.scandir(path) as it:
+      for entry in it:
+        try:
+          entries[entry.name] = entry.stat(follow_symlinks=False)
+        except FileNotFoundError:
+          continue
+  except FileNotFoundError:
+    pass
+  return entries
+
+
+def _remove_path(path: PyPath) -> None:
+  if path.is_dir() and not path.is_symlink():
+    shutil.rmtree(path)
+  else:
+    os.remove(path)
+
+
+class StartupReconciler:
+  """
+  Brings the in-memory catalog in line with what is actually on disk at startup.
+
+  The index, BOOKS_DIR (all shards, in parallel) and TMP_DIR are read
+  concurrently. Index entries whose .book file is missing are dropped. Files
+  are compared using stat fingerprints only; entries whose fingerprint differs
+  from the one recorded by the integrity scrubber are left for its first pass
+  to re-hash. Leftover upload
+  and extraction directories from crashed uploads are swept in the background,
+  at startup and then every `tmp_sweep_interval` seconds.
+  `catalog_ready` is set once reconciliation has completed.
+  """
+
+  def __init__(self, tmp_sweep_min_age: float = TMP_SWEEP_MIN_AGE, tmp_sweep_interval: float = TMP_SWEEP_INTERVAL):
+    self.tmp_sweep_min_age = tmp_sweep_min_age
+    self.tmp_sweep_interval = tmp_sweep_interval
+    self._tmp_dir = PyPath(TMP_DIR).resolve(strict=False)
+
+    self.report: Optional[Dict[str, object]] = None
+    self._task: Optional[asyncio.Task] = None
+    self._sweep_task: Optional[asyncio.Task] = None
+
+  def start(self) -> None:
+    """Starts reconciliation on the running event loop without blocking startup."""
+    if self._task is None:
+      self._task = asyncio.create_task(self.run(), name="startup-reconciler")
+
+  async def stop(self) -> None:
+    for task in (self._task, self._sweep_task):
+      if task is not None and not task.done():
+        task.cancel()
+        try:
+          await task
+        except asyncio.CancelledError:
+          pass
+
+  async def run(self) -> Dict[str, object]:
+    started = time.monotonic()
+    try:
+      _, book_files, tmp_files, _ = await asyncio.gather(
+        load_index(),
+        asyncio.to_thread(book_storage.scan),
+        asyncio.to_thread(_scan_dir, self._tmp_dir),
+        integrity_scrubber.load_state(),
+      )
+
+      async with index_lock:
+        entries = [(key, record.filename) for key, record in book_index.items()]
+
+      missing: List[str] = []
+      unverified = 0
+      indexed_files = set()
+      for book_key, book_filename in entries:
+        indexed_files.add(book_filename)
+        st = book_files.get(book_filename)
+        if st is None:
+          missing.append(book_key)
+        elif integrity_scrubber.verified.get(book_key) != FileFingerprint.from_stat(st):
+          unverified += 1
+
+      if missing:
+        async with index_lock:
+          for book_key in missing:
+            book_index.pop(book_key, None)
+        await save_index()
+        logger.error(f"Removed {len(missing)} index entries whose book file is missing: {missing}")
+
+      untracked = sorted(name for name in book_files if name.endswith(".book") and name not in indexed_files)
+      if untracked:
+        logger.warning(f"{len(untracked)} .book files in {book_storage.root} are not in the index.")
+
+      stale_tmp = self._stale_tmp(tmp_files)
+      self._sweep_task = asyncio.create_task(self._sweep_periodically(stale_tmp), name="tmp-sweeper")
+
+      self.report = {
+        "duration_seconds": round(time.monotonic() - started, 3),
+        "books": len(entries) - len(missing),
+        "missing": missing,
+        "unverified": unverified,
+        "untracked": len(untracked),
+        "stale_tmp": len(stale_tmp),
+      }
+    except Exception as e:
+      # Leave the catalog unready rather than advertise books that may not exist.
+      logger.critical(f"Startup reconciliation failed: {e}", exc_info=True)
+      raise
+
+    catalog_ready.set()
+    logger.info(f"Startup reconciliation complete: {self.report}")
+    return self.report
+
+  def _stale_tmp(self, tmp_files: Dict[str, os.stat_result]) -> List[PyPath]:
+    """Temp paths left by a worker that has exited, or older than `tmp_sweep_min_age`."""
+    now = time.time()
+    stale: List[PyPath] = []
+    for name, st in tmp_files.items():
+      if not name.startswith(_TMP_PREFIXES):
+        continue
+      owner = _TMP_OWNER.match(name)
+      if (owner is not None and not pid_alive(int(owner.group(1)))) or now - st.st_mtime >= self.tmp_sweep_min_age:
+        stale.append(self._tmp_dir / name)
+    return stale
+
+  async def _sweep_periodically(self, stale: List[PyPath]) -> None:
+    # Crashed workers are restarted within seconds, so their leftovers are
+    # usually found by a later pass rather than the one at startup.
+    while True:
+      if stale:
+        await self._sweep(stale)
+      await asyncio.sleep(self.tmp_sweep_interval)
+      try:
+        stale = self._stale_tmp(await asyncio.to_thread(_scan_dir, self._tmp_dir))
+      except Exception as e:
+        logger.error(f"Error scanning {self._tmp_dir} for stale temporary paths: {e}", exc_info=True)
+        stale = []
+
+  async def _sweep(self, paths: List[PyPath]) -> None:
+    removed = 0
+    for path in paths:
+      try:
+        await asyncio.to_thread(_remove_path, path)
+        removed += 1
+      except FileNotFoundError:
+        continue
+      except Exception as e:
+        logger.error(f"Error removing stale temporary path {path}: {e}", exc_info=True)
+    logger.info(f"Swept {removed} stale temporary paths from {self._tmp_dir}.")
+
+
+startup_reconciler = StartupReconciler()
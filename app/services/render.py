@@ -0,0 +1,222 @@
+import os
+import sys
+import json
+import asyncio
+import hashlib
+import tarfile
+
+from collections import OrderedDict
+from pathlib import Path as PyPath
+from typing import Any, Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+from fastapi import HTTPException, status
+from jinja2 import StrictUndefined, Template, TemplateSyntaxError, UndefinedError
+from jinja2.sandbox import SandboxedEnvironment
+
+from app import logger
+
+RENDER_TEMPLATE_CACHE_SIZE: int = int(os.getenv("RENDER_TEMPLATE_CACHE_SIZE", "4096"))
+RENDER_OUTPUT_CACHE_SIZE: int = int(os.getenv("RENDER_OUTPUT_CACHE_SIZE", "1024"))
+# Total memory of memoized rendered books per worker, in bytes. A rendered book
+# larger than this on its own is returned but not memoized.
+RENDER_OUTPUT_CACHE_BYTES: int = int(os.getenv("RENDER_OUTPUT_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+  """
+  A minimal size-bounded mapping that evicts the least recently used entry.
+  With `weigh`, the total weight of the entries is bounded by `maxweight` as
+  well, and entries heavier than `maxweight` on their own are not kept.
+  """
+
+  def __init__(self, maxsize: int, maxweight: Optional[int] = None, weigh: Optional[Callable[[V], int]] = None):
+    self.maxsize = maxsize
+    self.maxweight = maxweight
+    self.weigh = weigh
+    self.weight = 0
+    self._data: "OrderedDict[K, Tuple[V, int]]" = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+
+  def get(self, key: K) -> Optional[V]:
+    try:
+      value, _ = self._data[key]
+    except KeyError:
+      self.misses += 1
+      return None
+    self._data.move_to_end(key)
+    self.hits += 1
+    return value
+
+  def put(self, key: K, value: V) -> None:
+    weight = self.weigh(value) if self.weigh is not None else 0
+    self.pop(key)
+    if self.maxweight is not None and weight > self.maxweight:
+      return
+    self._data[key] = (value, weight)
+    self.weight += weight
+    while len(self._data) > self.maxsize or (self.maxweight is not None and self.weight > self.maxweight):
+      _, (_, evicted) = self._data.popitem(last=False)
+      self.weight -= evicted
+
+  def pop(self, key: K) -> Optional[V]:
+    entry = self._data.pop(key, None)
+    if entry is None:
+      return None
+    self.weight -= entry[1]
+    return entry[0]
+
+  def __len__(self) -> int:
+    return len(self._data)
+
+
+def _rendered_size(rendered: Dict[str, str]) -> int:
+  return sys.getsizeof(rendered) + sum(sys.getsizeof(chapter) + sys.getsizeof(content) for chapter, content in rendered.items())
+
+
+def variables_hash(variables: Dict[str, Any]) -> str:
+  """Stable hash of a variable set, independent of key order."""
+  canonical = json.dumps(variables, sort_keys=True, separators=(",", ":"), default=str)
+  return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class BookRenderer:
+  """
+  Renders the chapters of stored books as Jinja2 templates.
+
+  Chapters are compiled once per (book_key, chapter) and kept in an LRU cache.
+  Books are immutable once uploaded, so compiled templates never go stale.
+  Rendered books are memoized per (book_key, variables hash), which makes
+  repeated requests for the same variable set essentially free; the memo is
+  bounded by total size as well as by count. Books whose templates do not
+  compile are remembered too, so they are not read and parsed again.
+  """
+
+  def __init__(
+    self,
+    template_cache_size: int = RENDER_TEMPLATE_CACHE_SIZE,
+    output_cache_size: int = RENDER_OUTPUT_CACHE_SIZE,
+    output_cache_bytes: int = RENDER_OUTPUT_CACHE_BYTES,
+  ):
+    # Uploaded books are untrusted input; the sandbox blocks attribute access
+    # to Python internals from within templates.
+    self.environment = SandboxedEnvironment(undefined=StrictUndefined, keep_trailing_newline=True, autoescape=False)
+    self.templates: LRUCache[Tuple[str, str], Template] = LRUCache(template_cache_size)
+    self.outputs: LRUCache[Tuple[str, str], Dict[str, str]] = LRUCache(output_cache_size, output_cache_bytes, _rendered_size)
+    self._chapters: LRUCache[str, Tuple[str, ...]] = LRUCache(template_cache_size)
+    # book_key -> error detail of books whose templates do not compile.
+    self._invalid: LRUCache[str, str] = LRUCache(template_cache_size)
+    self._locks: Dict[str, asyncio.Lock] = {}
+
+  async def render(self, book_key: str, book_path: PyPath, variables: Dict[str, Any]) -> Tuple[str, Dict[str, str]]:
+    """
+    Renders every text chapter of the book with `variables`.
+    Returns the variables hash and a mapping of chapter path to rendered content.
+    Raises HTTPException on invalid templates or missing variables.
+    """
+    digest = variables_hash(variables)
+    cached = self.outputs.get((book_key, digest))
+    if cached is not None:
+      return digest, cached
+
+    templates = await self._get_templates(book_key, book_path)
+    rendered = await asyncio.to_thread(self._render_chapters, book_key, templates, variables)
+
+    self.outputs.put((book_key, digest), rendered)
+    return digest, rendered
+
+  def _render_chapters(self, book_key: str, templates: Dict[str, Template], variables: Dict[str, Any]) -> Dict[str, str]:
+    """Renders each chapter. Blocking."""
+    rendered: Dict[str, str] = {}
+    for chapter, template in templates.items():
+      try:
+        rendered[chapter] = template.render(variables)
+      except UndefinedError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Missing variable while rendering '{book_key}' chapter '{chapter}': {e.message}")
+      except Exception as e:
+        # Agent-supplied values can make any expression fail (e.g. `count + 1`
+        # with a string); that is a bad request, not a server error.
+        logger.warning(f"Error rendering book {book_key} chapter {chapter}: {e!r}", extra={"rate_limit": "render.error"})
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Error rendering '{book_key}' chapter '{chapter}': {type(e).__name__}: {e}")
+    return rendered
+
+  def _cached_templates(self, book_key: str) -> Optional[Dict[str, Template]]:
+    chapters = self._chapters.get(book_key)
+    if chapters is None:
+      return None
+    templates = {}
+    for chapter in chapters:
+      template = self.templates.get((book_key, chapter))
+      if template is None: # Evicted; the whole book is recompiled
+        return None
+      templates[chapter] = template
+    return templates
+
+  async def _get_templates(self, book_key: str, book_path: PyPath) -> Dict[str, Template]:
+    templates = self._cached_templates(book_key)
+    if templates is not None:
+      return templates
+    self._raise_if_invalid(book_key)
+
+    # Only one request per book reads and compiles it; the rest wait for the cache.
+    lock = self._locks.setdefault(book_key, asyncio.Lock())
+    try:
+      async with lock:
+        templates = self._cached_templates(book_key)
+        if templates is not None:
+          return templates
+
+        self._raise_if_invalid(book_key)
+
+        try:
+          templates = await asyncio.to_thread(self._compile_book, book_key, book_path)
+        except HTTPException as e:
+          # Books are immutable, so a template that does not compile never will.
+          # Read errors (5xx) may be transient and are retried.
+          if e.status_code == status.HTTP_400_BAD_REQUEST:
+            self._invalid.put(book_key, e.detail)
+          raise
+        self._chapters.put(book_key, tuple(templates))
+        for chapter, template in templates.items():
+          self.templates.put((book_key, chapter), template)
+    finally:
+      # Waiters already hold the lock object; later requests find the cache.
+      # Dropping it keeps `_locks` limited to books being compiled right now.
+      if self._locks.get(book_key) is lock:
+        del self._locks[book_key]
+    return templates
+
+  def _raise_if_invalid(self, book_key: str) -> None:
+    detail = self._invalid.get(book_key)
+    if detail is not None:
+      raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+  def _compile_book(self, book_key: str, book_path: PyPath) -> Dict[str, Template]:
+    """Reads the chapters out of a .book package and compiles them. Blocking."""
+    templates: Dict[str, Template] = {}
+    try:
+      with tarfile.open(book_path, "r:gz") as tar:
+        for member in tar.getmembers():
+          if not (member.isfile() and member.name.startswith("chapters/")):
+            continue
+          with tar.extractfile(member) as f:
+            raw = f.read()
+          try:
+            source = raw.decode("utf-8")
+          except UnicodeDecodeError:
+            # Binary chapters are not templates and are left out of the rendered output.
+            continue
+          chapter = member.name[len("chapters/"):]
+          templates[chapter] = self.environment.from_string(source)
+    except TemplateSyntaxError as e:
+      raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid template in '{book_key}' at line {e.lineno}: {e.message}")
+    except (tarfile.TarError, FileNotFoundError) as e:
+      logger.error(f"Error reading book package {book_path}: {e}", exc_info=True)
+      raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Stored book '{book_key}' could not be read.")
+    return templates
+
+
+book_renderer = BookRenderer()
@@ -0,0 +1,296 @@
+import os
+import json
+import time
+import shutil
+import asyncio
+import aiofiles
+import hashlib
+import datetime
+
+from pathlib import Path as PyPath
+from typing import Dict, List, NamedTuple, Optional
+
+import pytz
+
+try:
+  import fcntl
+except ImportError: # Windows; every process scrubs
+  fcntl = None
+
+from app import logger, QUARANTINE_DIR, SCRUB_STATE_FILE
+from app.routes.books import book_index, index_lock, remove_from_index, catalog_ready
+from app.services.catalog import CatalogRecord
+from app.services.storage import book_storage
+
+SCRUB_INTERVAL: float = float(os.getenv("SCRUB_INTERVAL", "3600"))
+SCRUB_RATE_MBPS: float = float(os.getenv("SCRUB_RATE_MBPS", "20"))
+SCRUB_QUARANTINE: bool = os.getenv("SCRUB_QUARANTINE", "true").lower() in ("1", "true", "yes")
+SCRUB_CHUNK_SIZE: int = 1024 * 1024
+# How often a worker that is not scrubbing checks whether the scrubbing worker has gone away.
+SCRUB_LEADER_RETRY: float = 60.0
+
+
+class FileFingerprint(NamedTuple):
+  """Cheap identity of a file on disk; if it is unchanged the content is assumed unchanged."""
+  size: int
+  mtime_ns: int
+  inode: int
+
+  @classmethod
+  def from_stat(cls, st: os.stat_result) -> "FileFingerprint":
+    return cls(st.st_size, st.st_mtime_ns, st.st_ino)
+
+
+class ScrubResult(NamedTuple):
+  book_key: str
+  book_filename: str
+  problem: str # "missing" or "mismatch"
+  detected_at: str
+
+
+class IntegrityScrubber:
+  """
+  Background task that re-verifies stored .book files against the
+  `book_checksum` recorded in the index.
+
+  Reads are throttled to `rate_mbps` so a pass never competes with downloads
+  for disk bandwidth. Files whose (size, mtime, inode) fingerprint matches the
+  one recorded at their last successful verification are skipped. The
+  fingerprints are persisted so that a restart does not trigger a full rehash.
+  Mismatching files are moved to QUARANTINE_DIR and dropped from the index
+  when `quarantine` is enabled; otherwise they are only reported.
+
+  Only one process per host scrubs: the holder of an flock on
+  `SCRUB_STATE_FILE.lock`. Other gunicorn workers wait and take over if it exits,
+  so the read rate stays at `rate_mbps` regardless of the worker count.
+  """
+
+  def __init__(
+    self,
+    interval: float = SCRUB_INTERVAL,
+    rate_mbps: float = SCRUB_RATE_MBPS,
+    quarantine: bool = SCRUB_QUARANTINE,
+  ):
+    self.interval = interval
+    self.rate_mbps = rate_mbps
+    self.quarantine = quarantine
+
+    self._quarantine_dir = PyPath(QUARANTINE_DIR).resolve(strict=False)
+    self._state_file = PyPath(SCRUB_STATE_FILE).resolve(strict=False)
+    self._lock_file = PyPath(f"{SCRUB_STATE_FILE}.lock").resolve(strict=False)
+    self._lock_fd: Optional[int] = None
+    self.leader = False
+
+    self.verified: Dict[str, FileFingerprint] = {}
+    self.problems: List[ScrubResult] = []
+    self.last_pass: Optional[Dict[str, object]] = None
+    self._task: Optional[asyncio.Task] = None
+
+  def start(self) -> None:
+    """Starts the background scrub loop on the running event loop."""
+    if self._task is None or self._task.done():
+      self._task = asyncio.create_task(self._run(), name="integrity-scrubber")
+      logger.info(f"Integrity scrubber started (interval={self.interval}s, rate={self.rate_mbps}MB/s, quarantine={self.quarantine}).")
+
+  async def stop(self) -> None:
+    """Stops the scrub loop. Progress of an interrupted pass is kept."""
+    if self._task is not None:
+      self._task.cancel()
+      try:
+        await self._task
+      except asyncio.CancelledError:
+        pass
+      self._task = None
+    if self.leader:
+      await self._save_state()
+      self.leader = False
+    if self._lock_fd is not None:
+      os.close(self._lock_fd) # Releases the flock
+      self._lock_fd = None
+
+  def _try_lead(self) -> bool:
+    """Takes the host-wide scrubber lock without blocking. Returns whether this process holds it."""
+    if fcntl is None:
+      return True
+    if self._lock_fd is None:
+      self._lock_fd = os.open(self._lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+      fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+      return False
+    return True
+
+  async def _run(self) -> None:
+    # Missing files are expected until startup reconciliation has pruned them.
+    await catalog_ready.wait()
+    while not self._try_lead():
+      await asyncio.sleep(min(self.interval, SCRUB_LEADER_RETRY))
+    self.leader = True
+    logger.info(f"Integrity scrubber lock {self._lock_file} acquired; this process scrubs.")
+    # The previous holder may have saved fingerprints since startup.
+    await self.load_state()
+    while True:
+      try:
+        await self.scrub()
+      except asyncio.CancelledError:
+        raise
+      except Exception as e:
+        logger.error(f"Integrity scrub pass failed: {e}", exc_info=True)
+      await asyncio.sleep(self.interval)
+
+  async def scrub(self) -> Dict[str, object]:
+    """Runs one verification pass over the whole catalog and returns its summary."""
+    started = time.monotonic()
+    async with index_lock:
+      entries = list(book_index.items())
+
+    checked = skipped = hashed_bytes = 0
+    problems: List[ScrubResult] = []
+    for book_key, record in entries:
+      book_path = await asyncio.to_thread(book_storage.locate, record.filename)
+      try:
+        if book_path is None:
+          raise FileNotFoundError(record.filename)
+        fingerprint = FileFingerprint.from_stat(await asyncio.to_thread(os.stat, book_path))
+      except FileNotFoundError:
+        logger.error(f"Integrity scrub: {book_key} is indexed but {record.filename} does not exist.")
+        self.verified.pop(book_key, None)
+        problems.append(self._result(book_key, record, "missing"))
+        continue
+
+      if self.verified.get(book_key) == fingerprint:
+        skipped += 1
+        continue
+
+      try:
+        checksum = await self._throttled_checksum(book_path, record.checksum_algo)
+      except FileNotFoundError:
+        # Removed between the stat and the read; picked up on the next pass.
+        continue
+      checked += 1
+      hashed_bytes += fingerprint.size
+      if checksum == record.checksum:
+        self.verified[book_key] = fingerprint
+        continue
+
+      logger.error(f"Integrity scrub: checksum mismatch for {book_key}. Expected: {record.checksum}, Got: {checksum}")
+      self.verified.pop(book_key, None)
+      problems.append(self._result(book_key, record, "mismatch"))
+      if self.quarantine:
+        await self._quarantine(book_key, book_path)
+
+    # Forget fingerprints of books that are no longer in the catalog.
+    current_keys = {key for key, _ in entries}
+    for stale_key in set(self.verified) - current_keys:
+      del self.verified[stale_key]
+
+    self.problems = problems
+    self.last_pass = {
+      "completed_at": datetime.datetime.now(tz=pytz.UTC).isoformat(),
+      "duration_seconds": round(time.monotonic() - started, 3),
+      "books": len(entries),
+      "checked": checked,
+      "skipped": skipped,
+      "hashed_bytes": hashed_bytes,
+      "problems": len(problems),
+    }
+    await self._save_state()
+    logger.info(f"Integrity scrub pass complete: {self.last_pass}")
+    return self.last_pass
+
+  async def _throttled_checksum(self, path: PyPath, hash_algo: str) -> str:
+    """
+    Hashes a file in chunks, sleeping between reads to stay under `rate_mbps`.
+    Each chunk is read and hashed in a worker thread, so the event loop only
+    schedules the chunks and serves requests in between, even when unthrottled.
+    """
+    hasher = hashlib.new(hash_algo)
+    bytes_per_second = self.rate_mbps * 1024 * 1024
+    started = time.monotonic()
+    total = 0
+    f = await asyncio.to_thread(open, path, "rb")
+    try:
+      while read := await asyncio.to_thread(_hash_chunk, f, hasher):
+        total += read
+        if bytes_per_second > 0:
+          ahead = total / bytes_per_second - (time.monotonic() - started)
+          if ahead > 0:
+            await asyncio.sleep(ahead)
+    finally:
+      await asyncio.to_thread(f.close)
+    return hasher.hexdigest()
+
+  async def _quarantine(self, book_key: str, book_path: PyPath) -> None:
+    """Moves a corrupted book out of BOOKS_DIR and removes it from the index."""
+    timestamp = datetime.datetime.now(tz=pytz.UTC).strftime("%Y%m%dT%H%M%SZ")
+    destination = self._quarantine_dir / f"{book_path.name}.{timestamp}"
+    try:
+      await asyncio.to_thread(self._quarantine_dir.mkdir, parents=True, exist_ok=True)
+      await asyncio.to_thread(shutil.move, book_path, destination)
+    except Exception as e:
+      logger.error(f"Failed to quarantine {book_path}: {e}", exc_info=True)
+      return
+
+    # Other workers may have added books since this one loaded the index, so
+    # the entry is removed from the file as it is now rather than from memory.
+    await remove_from_index(book_key)
+    logger.warning(f"Quarantined corrupted book {book_key} to {destination}.")
+
+  def _result(self, book_key: str, record: CatalogRecord, problem: str) -> ScrubResult:
+    return ScrubResult(book_key, record.filename, problem, datetime.datetime.now(tz=pytz.UTC).isoformat())
+
+  def status(self) -> Dict[str, object]:
+    """Summary of the last completed pass and the problems it found."""
+    return {
+      "leader": self.leader,
+      "last_pass": self.last_pass,
+      "verified": len(self.verified),
+      "problems": [problem._asdict() for problem in self.problems],
+    }
+
+  async def load_state(self) -> None:
+    """Loads the fingerprints of previously verified books from SCRUB_STATE_FILE."""
+    if not os.path.exists(self._state_file):
+      return
+    try:
+      async with aiofiles.open(self._state_file, mode="r") as f:
+        state = json.loads(await f.read())
+      self.verified = {key: FileFingerprint(*value) for key, value in state.items()}
+    except (json.JSONDecodeError, IOError, TypeError) as e:
+      logger.warning(f"Error loading scrub state file: {e}. All books will be re-verified.")
+      self.verified = {}
+    logger.info(f"Scrub state loaded with {len(self.verified)} verified books.")
+
+  async def _save_state(self) -> None:
+    state = json.dumps({key: list(value) for key, value in self.verified.items()})
+    try:
+      await asyncio.to_thread(_write_atomic, self._state_file, state)
+    except IOError as e:
+      logger.error(f"Error saving scrub state file: {e}.")
+
+
+def _hash_chunk(f, hasher) -> int:
+  """Reads the next chunk of `f` into `hasher`. Returns its size, 0 at EOF. Blocking."""
+  chunk = f.read(SCRUB_CHUNK_SIZE)
+  hasher.update(chunk)
+  return len(chunk)
+
+
+def _write_atomic(path: PyPath, content: str) -> None:
+  """Replaces `path` with `content` so readers never see a partial file. Blocking."""
+  tmp_path = f"{path}.{os.getpid()}.tmp"
+  try:
+    with open(tmp_path, "w") as f:
+      f.write(content)
+      f.flush()
+      os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+  except BaseException:
+    try:
+      os.remove(tmp_path)
+    except FileNotFoundError:
+      pass
+    raise
+
+
+integrity_scrubber = IntegrityScrubber()
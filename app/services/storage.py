@@ -0,0 +1,169 @@
+"""
+Storage layout of .book files under BOOKS_DIR.
+
+Books are spread over a two-level fan-out keyed on the SHA-256 of their
+filename, e.g. `books/3f/a2/nginx-1.2.0.book`, so no directory ever holds
+more than a small fraction of the catalog. Books stored by earlier versions
+directly in BOOKS_DIR are still found, and can be moved into the sharded
+layout while the operator is running:
+
+  python -m app.services.storage migrate [--dry-run]
+"""
+import os
+import shutil
+import hashlib
+import argparse
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path as PyPath
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app import logger, BOOKS_DIR, is_within_directory
+
+# Hex characters per fan-out level; two levels of two give 65,536 leaf directories.
+SHARD_WIDTH: int = 2
+SHARD_DEPTH: int = 2
+
+
+class BookStorage:
+  """Maps book filenames to paths under BOOKS_DIR and moves files in and out of it."""
+
+  def __init__(self, root: str = BOOKS_DIR):
+    self.root = PyPath(root).resolve(strict=False)
+
+  def shard_dir(self, filename: str) -> PyPath:
+    digest = hashlib.sha256(filename.encode("utf-8")).hexdigest()
+    parts = [digest[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH] for i in range(SHARD_DEPTH)]
+    return self.root.joinpath(*parts)
+
+  def path_for(self, filename: str) -> PyPath:
+    """
+    Where a book with this filename is stored in the sharded layout.
+    Raises ValueError unless the filename is a plain name inside the root.
+    """
+    return self._checked(filename, self.shard_dir(filename) / filename)
+
+  def flat_path(self, filename: str) -> PyPath:
+    """Where the book lived in the original flat layout."""
+    return self._checked(filename, self.root / filename)
+
+  def _checked(self, filename: str, path: PyPath) -> PyPath:
+    if filename in ("", ".", "..") or os.path.basename(filename) != filename or not is_within_directory(self.root, path):
+      raise ValueError(f"Book filename {filename!r} does not map to a path inside {self.root}")
+    return path
+
+  def locate(self, filename: str) -> Optional[PyPath]:
+    """
+    Returns the current path of a stored book, or None if it does not exist.
+    Blocking. The sharded path is checked again last, so a book being moved
+    by a concurrent migration is never reported as missing.
+    """
+    try:
+      sharded = self.path_for(filename)
+    except ValueError:
+      return None
+    for candidate in (sharded, self.flat_path(filename), sharded):
+      if candidate.is_file():
+        return candidate
+    return None
+
+  def store(self, source: PyPath, filename: str) -> PyPath:
+    """Moves a validated package into its final location. Blocking."""
+    destination = self.path_for(filename)
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    shutil.move(source, destination)
+    return destination
+
+  def scan(self, workers: int = 16) -> Dict[str, os.stat_result]:
+    """
+    Returns filename -> stat of every .book file in both layouts. Blocking.
+    Top-level shard directories are listed in parallel.
+    """
+    files: Dict[str, os.stat_result] = {}
+    top_level: List[PyPath] = []
+    for name, st, is_dir in _scandir(self.root):
+      if is_dir:
+        top_level.append(self.root / name)
+      elif name.endswith(".book"):
+        files[name] = st
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+      for shard_files in pool.map(_scan_tree, top_level):
+        files.update(shard_files)
+    return files
+
+  def iter_flat(self) -> Iterator[Tuple[str, os.stat_result]]:
+    """Books still stored directly in BOOKS_DIR."""
+    for name, st, is_dir in _scandir(self.root):
+      if not is_dir and name.endswith(".book"):
+        yield name, st
+
+  def migrate(self, dry_run: bool = False) -> int:
+    """
+    Moves every book from the flat layout into its shard. Blocking.
+
+    Each book is hard-linked into place before the flat name is removed, so
+    it is reachable through `locate` at every point of the move and the
+    operator can keep serving while the migration runs.
+    """
+    moved = 0
+    for name, _ in list(self.iter_flat()):
+      source = self.flat_path(name)
+      destination = self.path_for(name)
+      if dry_run:
+        logger.info(f"Would move {source} -> {destination}")
+        moved += 1
+        continue
+      destination.parent.mkdir(parents=True, exist_ok=True)
+      try:
+        os.link(source, destination)
+      except FileExistsError:
+        pass # Already linked by an interrupted earlier run
+      except FileNotFoundError:
+        continue
+      except OSError:
+        # Filesystem without hard links; a rename is still atomic.
+        os.replace(source, destination)
+        moved += 1
+        continue
+      os.unlink(source)
+      moved += 1
+    logger.info(f"{'Would migrate' if dry_run else 'Migrated'} {moved} books to the sharded layout in {self.root}.")
+    return moved
+
+
+def _scandir(path: PyPath) -> Iterator[Tuple[str, os.stat_result, bool]]:
+  try:
+    with os.scandir(path) as it:
+      for entry in it:
+        try:
+          yield entry.name, entry.stat(follow_symlinks=False), entry.is_dir(follow_symlinks=False)
+        except FileNotFoundError:
+          continue
+  except FileNotFoundError:
+    return
+
+
+def _scan_tree(path: PyPath) -> Dict[str, os.stat_result]:
+  files: Dict[str, os.stat_result] = {}
+  for name, st, is_dir in _scandir(path):
+    if is_dir:
+      files.update(_scan_tree(path / name))
+    elif name.endswith(".book"):
+      files[name] = st
+  return files
+
+
+book_storage = BookStorage()
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Manage the BOOKS_DIR storage layout.")
+  subcommands = parser.add_subparsers(dest="command", required=True)
+  migrate_parser = subcommands.add_parser("migrate", help="Move books from the flat layout into hash-prefix shards.")
+  migrate_parser.add_argument("--books-dir", default=BOOKS_DIR)
+  migrate_parser.add_argument("--dry-run", action="store_true")
+  args = parser.parse_args()
+
+  if args.command == "migrate":
+    BookStorage(args.books_dir).migrate(dry_run=args.dry_run)
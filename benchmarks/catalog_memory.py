@@ -0,0 +1,71 @@
+"""
+Compares the memory held by the book index as plain dicts (json.loads of
+index.json, as the operator used to keep it) with the compact `Catalog`.
+
+Usage: python -m benchmarks.catalog_memory --entries 100000
+"""
+import os
+import gc
+import json
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+from app.services.catalog import Catalog
+from benchmarks.synthetic import synthetic_entry
+
+
+def write_index(path: str, entries: int, seed: int = 0) -> None:
+  rng = random.Random(seed)
+  index = {}
+  for i in range(entries):
+    entry = synthetic_entry(i, rng)
+    index[f"{entry['name']}-{entry['version']}"] = entry
+  with open(path, "w") as f:
+    json.dump(index, f, indent=2)
+
+
+def measure(load) -> tuple:
+  gc.collect()
+  tracemalloc.start()
+  obj = load()
+  gc.collect()
+  current, peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  return obj, current, peak
+
+
+def _loaded(path: str) -> Catalog:
+  catalog = Catalog()
+  catalog.load(path)
+  return catalog
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--entries", type=int, default=100_000)
+  args = parser.parse_args()
+
+  with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp, "index.json")
+    write_index(path, args.entries)
+
+    def load_dicts():
+      with open(path) as f:
+        return json.load(f)
+    dicts, dict_bytes, dict_peak = measure(load_dicts)
+    del dicts
+
+    # The first load converts the pretty-printed index to the line layout.
+    Catalog().load(path)
+    catalog, catalog_bytes, catalog_peak = measure(lambda: _loaded(path))
+    print(f"entries:           {len(catalog):>12,}")
+    print(f"index file:        {os.path.getsize(path) / 2**20:>10.1f} MiB (shared, memory-mapped)")
+    print(f"dicts retained:    {dict_bytes / 2**20:>10.1f} MiB   peak {dict_peak / 2**20:.1f} MiB")
+    print(f"catalog retained:  {catalog_bytes / 2**20:>10.1f} MiB   peak {catalog_peak / 2**20:.1f} MiB")
+    print(f"reduction:         {dict_bytes / max(catalog_bytes, 1):>10.1f}x")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,480 @@
+"""
+End-to-end load test: a simulated fleet of agents against a locally started
+operator, with SQLite standing in for Postgres.
+
+Each agent is an asyncio task that registers (/register/), checks in
+(/config/) every --interval seconds, and on each check-in reads the book
+index and downloads (and sometimes renders) the books published for its
+platform and architecture that it does not have yet. Agent types, platforms
+and architectures are drawn from weighted mixes.
+
+The books are stored in BOOKS_DIR and index.json before the operator starts,
+so every worker serves the same catalog.
+
+Arrival patterns:
+  steady  agents register at random over --ramp seconds, then keep checking
+          in until --duration, as a fleet does day to day
+  herd    the same steady fleet; at --release-at a new book is released and
+          every agent's next check-in, with the index read and download that
+          follow, is squeezed into --herd-window seconds
+
+Throughput, error rate and latency percentiles are reported per phase
+(steady, herd) and endpoint. Run the same fleet against different --workers
+and --pool-size values to size gunicorn workers and database pools.
+
+Usage: python -m benchmarks.fleet --agents 5000 --arrival herd --herd-window 2 --workers 4
+       python -m benchmarks.fleet --url http://operator:8000 --agents 1000   (existing operator)
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import shutil
+import signal
+import tarfile
+import datetime
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import importlib.util
+
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+import httpx
+
+from app import BOOKS_DIR, INDEX_FILE, calculate_sha256
+from app.enums import Mode, State, Type
+from app.enums.books import Architecture, Platform
+from app.models.books import Metadata
+from app.services.catalog import Catalog
+from app.services.storage import BookStorage
+from benchmarks.hot_paths import percentile
+from benchmarks.synthetic import write_book
+
+REPO_ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_TYPES = "HOST=70,CONTAINER=25,NETWORK=4,UNKNOWN=1"
+DEFAULT_PLATFORMS = (
+  "UBUNTU_22_04=25,UBUNTU_24_04=15,REDHAT_9=15,DEBIAN_12=10,ROCKY_LINUX_9=10,"
+  "AMAZON_LINUX_2023=10,WINDOWS_SERVER_2022=10,MACOS_SONOMA=5"
+)
+DEFAULT_ARCHITECTURES = "X86_64=60,AMD64=15,ARM64=20,PPC64LE=3,S390X=2"
+
+
+def parse_mix(spec: str, enum) -> Tuple[List, List[float]]:
+  """Parses 'MEMBER=weight,...' into members of `enum` and their weights."""
+  members, weights = [], []
+  for item in filter(None, (part.strip() for part in spec.split(","))):
+    name, _, weight = item.partition("=")
+    members.append(enum[name.strip()])
+    weights.append(float(weight or 1))
+  return members, weights
+
+
+class Stats:
+  """Latencies and outcomes per phase and endpoint template, e.g. 'GET /books/{book_key}/download'."""
+
+  def __init__(self):
+    self.latencies: Dict[Tuple[str, str], List[float]] = defaultdict(list)
+    self.statuses: Dict[Tuple[str, str], Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    self.errors: Dict[Tuple[str, str], int] = defaultdict(int)
+    self.spans: Dict[str, List[float]] = {} # phase -> [first request start, last request end]
+
+  def record(self, phase: str, endpoint: str, started: float, ended: float, outcome: str, ok: bool) -> None:
+    key = (phase, endpoint)
+    self.latencies[key].append(ended - started)
+    self.statuses[key][outcome] += 1
+    if not ok:
+      self.errors[key] += 1
+    span = self.spans.setdefault(phase, [started, ended])
+    span[0] = min(span[0], started)
+    span[1] = max(span[1], ended)
+
+  def summary(self) -> Dict[str, Dict[str, object]]:
+    report: Dict[str, Dict[str, object]] = {}
+    for (phase, endpoint), samples in sorted(self.latencies.items()):
+      ordered = sorted(samples)
+      span = self.spans[phase][1] - self.spans[phase][0]
+      phase_report = report.setdefault(phase, {"seconds": span, "endpoints": {}})
+      phase_report["endpoints"][endpoint] = {
+        "requests": len(ordered),
+        "per_sec": len(ordered) / span if span else 0.0,
+        "error_rate": self.errors[(phase, endpoint)] / len(ordered),
+        "p50_ms": percentile(ordered, 0.50) * 1000,
+        "p95_ms": percentile(ordered, 0.95) * 1000,
+        "p99_ms": percentile(ordered, 0.99) * 1000,
+        "max_ms": ordered[-1] * 1000,
+        "statuses": dict(self.statuses[(phase, endpoint)]),
+      }
+    return report
+
+
+class SimulatedAgent:
+  """One node of the fleet, with the payloads a MethodosAgent would send."""
+
+  def __init__(self, index: int, rng: random.Random, agent_type: Type, platform: Platform, architecture: Architecture):
+    self.uuid = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+    self.fqdn = f"node-{index:06d}.fleet.example.com"
+    self.type = agent_type
+    self.platform = platform
+    self.architecture = architecture
+    self.version = rng.choice(("1.0.0", "1.0.1", "1.1.0"))
+    self.mode = rng.choices((Mode.ENFORCING, Mode.MONITORING), (80, 20))[0]
+    self.uptime = rng.randrange(60, 90 * 24 * 3600)
+    self.books: Set[str] = set()
+    self.saw_release = False
+
+  def registration(self) -> dict:
+    return {"fqdn": self.fqdn, "uuid": self.uuid, "type": self.type.value, "version": self.version}
+
+  def check_in(self) -> dict:
+    return {
+      "fqdn": self.fqdn,
+      "uuid": self.uuid,
+      "type": self.type.value,
+      "state": State.ACTIVE.value,
+      "mode": self.mode.value,
+      "version": self.version,
+      "uptime": self.uptime,
+      "cert": f"-----BEGIN CERTIFICATE-----\n{self.uuid}\n-----END CERTIFICATE-----\n",
+    }
+
+
+class Fleet:
+  """
+  Drives the agents. Times are seconds since `started`.
+
+  In herd mode the release book is already stored but hidden from agents
+  until their slot in the herd window: at `release_at` every agent's next
+  check-in is moved to a random point in [release_at, release_at + herd_window],
+  and only that check-in, with the index read and downloads that follow it,
+  counts towards the "herd" phase.
+  """
+
+  def __init__(self, client: httpx.AsyncClient, args: argparse.Namespace, release_key: Optional[str]):
+    self.client = client
+    self.args = args
+    self.release_key = release_key
+    self.stats = Stats()
+    self.rng = random.Random(args.seed)
+    self.started = 0.0
+    self.release_at = args.release_at if args.release_at is not None else args.ramp + args.interval
+    self.end_at = args.duration
+    if args.arrival == "herd":
+      self.end_at = max(args.duration, self.release_at + args.herd_window)
+
+  def now(self) -> float:
+    return time.perf_counter() - self.started
+
+  async def sleep_until(self, at: float) -> None:
+    delay = at - self.now()
+    if delay > 0:
+      await asyncio.sleep(delay)
+
+  async def request(self, phase: str, method: str, endpoint: str, url: str, **kwargs) -> Optional[httpx.Response]:
+    started = time.perf_counter()
+    try:
+      if method == "GET" and "/download" in endpoint:
+        # Stream and discard, as an agent writing the book to disk would.
+        async with self.client.stream(method, url, **kwargs) as response:
+          async for _ in response.aiter_bytes(1024 * 1024):
+            pass
+      else:
+        response = await self.client.request(method, url, **kwargs)
+    except httpx.HTTPError as e:
+      self.stats.record(phase, endpoint, started, time.perf_counter(), type(e).__name__, False)
+      return None
+    self.stats.record(phase, endpoint, started, time.perf_counter(), str(response.status_code), response.is_success)
+    return response
+
+  async def publish(self, path: str, phase: str = "publish") -> None:
+    with open(path, "rb") as f:
+      content = f.read()
+    response = await self.request(phase, "POST", "POST /books/upload", "/books/upload", files={"file": (os.path.basename(path), content)})
+    if response is not None and response.status_code not in (201, 409):
+      print(f"Publishing {path} failed: {response.status_code} {response.text}", file=sys.stderr)
+
+  async def run_agent(self, agent: SimulatedAgent, arrival: float, herd_at: Optional[float]) -> None:
+    await self.sleep_until(arrival)
+    response = await self.request("steady", "POST", "POST /register/", "/register/", json=agent.registration())
+    if response is None or response.status_code not in (201, 409):
+      return
+
+    next_checkin = self.now()
+    while True:
+      at, phase = next_checkin, "steady"
+      if herd_at is not None and not agent.saw_release and next_checkin >= self.release_at:
+        # The release squeezes the agent's next check-in into the herd window.
+        at, phase = herd_at, "herd"
+      if at >= self.end_at:
+        return
+      await self.sleep_until(at)
+      if phase == "herd":
+        agent.saw_release = True
+      await self.check_in(agent, phase)
+      next_checkin = at + self.args.interval * self.rng.uniform(0.8, 1.2)
+
+  async def check_in(self, agent: SimulatedAgent, phase: str) -> None:
+    await self.request(phase, "POST", "POST /config/", "/config/", json=agent.check_in())
+
+    response = await self.request(phase, "GET", "GET /books/index", "/books/index")
+    if response is None or not response.is_success:
+      return
+    wanted = [
+      book_key for book_key, entry in response.json().items()
+      if book_key not in agent.books
+      and (book_key != self.release_key or agent.saw_release)
+      and agent.platform.value in entry.get("supported_platforms", ())
+      and agent.architecture.value in entry.get("supported_architectures", ())
+    ]
+    for book_key in wanted:
+      response = await self.request(phase, "GET", "GET /books/{book_key}/download", f"/books/{book_key}/download")
+      if response is not None and response.is_success:
+        agent.books.add(book_key)
+      if self.rng.random() < self.args.render_ratio:
+        await self.request(
+          phase, "POST", "POST /books/{book_key}/render", f"/books/{book_key}/render",
+          json={"variables": {"hostname": agent.fqdn, "architecture": agent.architecture.value}},
+        )
+
+  def spawn(self) -> List[SimulatedAgent]:
+    types, type_weights = parse_mix(self.args.types, Type)
+    platforms, platform_weights = parse_mix(self.args.platforms, Platform)
+    architectures, architecture_weights = parse_mix(self.args.architectures, Architecture)
+    return [
+      SimulatedAgent(
+        i, self.rng,
+        self.rng.choices(types, type_weights)[0],
+        self.rng.choices(platforms, platform_weights)[0],
+        self.rng.choices(architectures, architecture_weights)[0],
+      )
+      for i in range(self.args.agents)
+    ]
+
+  def schedule(self) -> List[Tuple[float, Optional[float]]]:
+    """(arrival, herd slot) per agent. Agents join uniformly over the ramp in both modes."""
+    herd = self.args.arrival == "herd"
+    return [
+      (
+        self.rng.uniform(0, self.args.ramp),
+        self.release_at + self.rng.uniform(0, self.args.herd_window) if herd else None,
+      )
+      for _ in range(self.args.agents)
+    ]
+
+
+def build_books(root: str, args: argparse.Namespace) -> List[str]:
+  """Synthetic books supporting every platform and architecture in the mixes, so each agent pulls all of them."""
+  platforms = parse_mix(args.platforms, Platform)[0]
+  architectures = parse_mix(args.architectures, Architecture)[0]
+  paths = []
+  for i in range(args.books + 1):
+    path = os.path.join(root, f"fleet-book-{i}.book")
+    write_book(
+      path, name=f"fleet-book-{i}", version="1.0.0", chapters=args.chapters, chapter_size=args.chapter_size,
+      seed=args.seed + i, workdir=root, platforms=platforms, architectures=architectures,
+    )
+    paths.append(path)
+  return paths
+
+
+def book_key_of(path: str) -> str:
+  with tarfile.open(path, "r:gz") as tar:
+    metadata = json.load(tar.extractfile("metadata.json"))
+  return f"{metadata['name']}-{metadata['version']}"
+
+
+def seed_catalog(root: str, paths: List[str]) -> None:
+  """
+  Stores the books in their BOOKS_DIR shards and writes index.json the way
+  `upload_book` would, before the operator starts. Every worker then loads
+  the same catalog; a book uploaded at runtime is only known to the worker
+  that received it.
+  """
+  storage = BookStorage(os.path.join(root, BOOKS_DIR))
+  catalog = Catalog()
+  for path in paths:
+    with tarfile.open(path, "r:gz") as tar:
+      metadata = Metadata(**json.load(tar.extractfile("metadata.json")))
+    book_key = f"{metadata.name}-{metadata.version}"
+    entry = metadata.model_dump(mode="json")
+    entry["book_filename"] = f"{book_key}.book"
+    entry["book_checksum_algo"] = "sha256"
+    entry["book_checksum"] = calculate_sha256(path)
+    entry["book_upload_timestamp"] = datetime.datetime.now(tz=datetime.timezone.utc).isoformat()
+    destination = storage.path_for(entry["book_filename"])
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copyfile(path, destination)
+    catalog.add(book_key, entry)
+  catalog.save(os.path.join(root, INDEX_FILE))
+
+
+# --- Operator process ---
+
+def _free_port() -> int:
+  with socket.socket() as s:
+    s.bind(("127.0.0.1", 0))
+    return s.getsockname()[1]
+
+
+def start_operator(root: str, args: argparse.Namespace) -> Tuple[subprocess.Popen, str]:
+  port = _free_port()
+  env = {
+    **os.environ,
+    "PYTHONPATH": os.pathsep.join(filter(None, (REPO_ROOT, os.environ.get("PYTHONPATH")))),
+    "DATABASE_URL": f"sqlite:///{os.path.join(root, 'fleet.db')}",
+    "DB_POOL_SIZE": str(args.pool_size),
+    "DB_MAX_OVERFLOW": str(args.max_overflow),
+    "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+  }
+  # Create the schema once, rather than racing create_all in every worker. The
+  # models must be imported first, or the metadata is empty and nothing is created.
+  subprocess.run(
+    [sys.executable, "-c", "import asyncio; import app.models.sql; from app.database import init_db; asyncio.run(init_db())"],
+    cwd=root, env=env, check=True,
+  )
+
+  if args.server == "gunicorn":
+    command = [
+      sys.executable, "-m", "gunicorn", "app.main:application", "-k", "uvicorn.workers.UvicornWorker",
+      "--workers", str(args.workers), "--bind", f"127.0.0.1:{port}",
+    ]
+  else:
+    command = [
+      sys.executable, "-m", "uvicorn", "app.main:application", "--workers", str(args.workers),
+      "--host", "127.0.0.1", "--port", str(port), "--no-access-log",
+    ]
+  log = open(os.path.join(root, "operator.log"), "wb")
+  process = subprocess.Popen(command, cwd=root, env=env, stdout=log, stderr=subprocess.STDOUT)
+  return process, f"http://127.0.0.1:{port}"
+
+
+async def wait_ready(client: httpx.AsyncClient, process: Optional[subprocess.Popen], timeout: float = 60) -> None:
+  deadline = time.monotonic() + timeout
+  while time.monotonic() < deadline:
+    if process is not None and process.poll() is not None:
+      raise RuntimeError(f"Operator exited with status {process.returncode}")
+    try:
+      if (await client.get("/health/ready")).status_code == 200:
+        return
+    except httpx.HTTPError:
+      pass
+    await asyncio.sleep(0.2)
+  raise RuntimeError("Operator did not become ready in time")
+
+
+# --- Main ---
+
+def print_report(report: Dict[str, Dict[str, object]]) -> None:
+  for phase, phase_report in report.items():
+    print(f"\n{phase} phase ({phase_report['seconds']:.1f}s)")
+    print(f"{'endpoint':<36}{'requests':>10}{'req/s':>9}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}  statuses")
+    for endpoint, row in phase_report["endpoints"].items():
+      statuses = " ".join(f"{status}:{count}" for status, count in sorted(row["statuses"].items()))
+      print(
+        f"{endpoint:<36}{row['requests']:>10}{row['per_sec']:>9.1f}{row['error_rate']:>8.1%}"
+        f"{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['max_ms']:>9.1f}  {statuses}"
+      )
+
+
+async def simulate(
+    args: argparse.Namespace, base_url: str, process: Optional[subprocess.Popen], books: List[str], seeded: bool,
+) -> Dict[str, object]:
+  limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+  async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+    await wait_ready(client, process)
+    release = books[-1]
+    fleet = Fleet(client, args, book_key_of(release) if args.arrival == "herd" else None)
+    if not seeded:
+      # A running operator is only reachable over HTTP; the release is published at release time.
+      for path in books if args.arrival == "steady" else books[:-1]:
+        await fleet.publish(path)
+
+    agents = fleet.spawn()
+    schedule = fleet.schedule()
+    print(
+      f"Simulating {len(agents):,} agents ({args.arrival}, ramp {args.ramp}s, check-ins every {args.interval}s"
+      + (f", release at {fleet.release_at}s, herd window {args.herd_window}s" if args.arrival == "herd" else "")
+      + f", {fleet.end_at}s) against {base_url}",
+      file=sys.stderr,
+    )
+
+    async def release_book() -> None:
+      await fleet.sleep_until(fleet.release_at)
+      await fleet.publish(release, "herd")
+
+    fleet.started = time.perf_counter()
+    tasks = [fleet.run_agent(agent, arrival, herd_at) for agent, (arrival, herd_at) in zip(agents, schedule)]
+    if args.arrival == "herd" and not seeded:
+      tasks.append(release_book())
+    await asyncio.gather(*tasks)
+    elapsed = fleet.now()
+
+  report = fleet.stats.summary()
+  print_report(report)
+  return {"elapsed_seconds": elapsed, "phases": report}
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--agents", type=int, default=1000)
+  parser.add_argument("--arrival", choices=("steady", "herd"), default="steady")
+  parser.add_argument("--ramp", type=float, default=30.0, help="Seconds over which agents first register")
+  parser.add_argument("--interval", type=float, default=10.0, help="Seconds between an agent's check-ins")
+  parser.add_argument("--duration", type=float, default=60.0, help="Seconds to run for")
+  parser.add_argument("--release-at", type=float, default=None, help="Herd: seconds until the release (default: ramp + interval)")
+  parser.add_argument("--herd-window", type=float, default=5.0, help="Herd: seconds within which every agent checks in after the release")
+  parser.add_argument("--render-ratio", type=float, default=0.1, help="Fraction of downloads followed by a render")
+  parser.add_argument("--types", default=DEFAULT_TYPES, help="Weighted agent Type mix, e.g. HOST=70,CONTAINER=30")
+  parser.add_argument("--platforms", default=DEFAULT_PLATFORMS, help="Weighted Platform mix")
+  parser.add_argument("--architectures", default=DEFAULT_ARCHITECTURES, help="Weighted Architecture mix")
+  parser.add_argument("--books", type=int, default=5, help="Books in the catalog before the fleet starts")
+  parser.add_argument("--chapters", type=int, default=20)
+  parser.add_argument("--chapter-size", type=int, default=4096)
+  parser.add_argument("--connections", type=int, default=500, help="Client connection pool size")
+  parser.add_argument("--timeout", type=float, default=30.0)
+  parser.add_argument("--seed", type=int, default=0)
+  parser.add_argument("--url", default=None, help="Use a running operator instead of starting one")
+  parser.add_argument("--server", choices=("gunicorn", "uvicorn"), default="gunicorn" if importlib.util.find_spec("gunicorn") else "uvicorn")
+  parser.add_argument("--workers", type=int, default=1)
+  parser.add_argument("--pool-size", type=int, default=10, help="DB_POOL_SIZE of each worker")
+  parser.add_argument("--max-overflow", type=int, default=20, help="DB_MAX_OVERFLOW of each worker")
+  parser.add_argument("--output", default=None, help="Also write the report as JSON")
+  args = parser.parse_args()
+
+  with tempfile.TemporaryDirectory(prefix="methodos-fleet-") as root:
+    books = build_books(root, args)
+    process = None
+    base_url = args.url
+    if base_url is None:
+      seed_catalog(root, books)
+      process, base_url = start_operator(root, args)
+      print(f"Started operator ({args.server}, {args.workers} workers, pool {args.pool_size}+{args.max_overflow}) at {base_url}", file=sys.stderr)
+    try:
+      result = asyncio.run(simulate(args, base_url, process, books, seeded=process is not None))
+    except Exception:
+      if process is not None:
+        with open(os.path.join(root, "operator.log"), "rb") as f:
+          print(b"".join(f.readlines()[-20:]).decode(errors="replace"), file=sys.stderr)
+      raise
+    finally:
+      if process is not None:
+        process.send_signal(signal.SIGTERM)
+        try:
+          process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+          process.kill()
+
+  if args.output:
+    result["config"] = {key: value for key, value in vars(args).items()}
+    with open(args.output, "w") as f:
+      json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,391 @@
+"""
+Benchmarks the book ingestion and catalog hot paths: `upload_book`,
+`_extract_and_validate_tar`, `calculate_dir_checksum`, `save_index`,
+`load_index` and `get_book_index`.
+
+Every case runs in its own process with a fresh working directory, so the
+operator's TMP_DIR, BOOKS_DIR and INDEX_FILE resolve there and peak RSS is
+that of the case alone. Inputs come from `benchmarks.synthetic` and are
+generated once per run from a fixed seed.
+
+Results are compared against a stored baseline when one exists. A case whose
+median latency or peak RSS grew by more than the tolerance is reported as a
+regression and makes the run exit with status 1. Baselines are only
+meaningful on the machine that recorded them.
+
+Usage: python -m benchmarks.hot_paths [--catalog-sizes 1000,10000,100000,1000000]
+                                      [--chapters 50] [--chapter-size 16384] [--iterations 20]
+                                      [--only upload,load_index] [--baseline PATH] [--save-baseline]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import logging
+import platform
+import resource
+import tarfile
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from benchmarks.synthetic import write_book, write_catalog
+
+DEFAULT_BASELINE: str = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# Seconds per iteration, and bytes processed by each iteration.
+_Samples = Tuple[List[float], int]
+
+
+class Case:
+  """One benchmark: a hot path at a given input size."""
+
+  def __init__(self, kind: str, label: str, iterations: int, catalog_entries: int = 0):
+    self.kind = kind
+    self.label = label
+    self.iterations = iterations
+    self.catalog_entries = catalog_entries
+
+  @property
+  def name(self) -> str:
+    return f"{self.kind}[{self.label}]"
+
+
+def percentile(sorted_samples: List[float], fraction: float) -> float:
+  """Nearest-rank percentile of already sorted samples."""
+  if not sorted_samples:
+    return 0.0
+  rank = max(1, min(len(sorted_samples), round(fraction * len(sorted_samples) + 0.5)))
+  return sorted_samples[rank - 1]
+
+
+def summarize(samples: List[float], nbytes: int, peak_rss: int) -> Dict[str, float]:
+  ordered = sorted(samples)
+  total = sum(ordered)
+  return {
+    "iterations": len(ordered),
+    "ops_per_sec": len(ordered) / total if total else 0.0,
+    "mb_per_sec": nbytes * len(ordered) / total / 1e6 if total and nbytes else 0.0,
+    "mean_ms": total / len(ordered) * 1000 if ordered else 0.0,
+    "p50_ms": percentile(ordered, 0.50) * 1000,
+    "p95_ms": percentile(ordered, 0.95) * 1000,
+    "p99_ms": percentile(ordered, 0.99) * 1000,
+    "max_ms": ordered[-1] * 1000 if ordered else 0.0,
+    "peak_rss_mib": peak_rss / 2**20,
+  }
+
+
+def _peak_rss() -> int:
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # Kilobytes on Linux, bytes on macOS.
+  return peak if sys.platform == "darwin" else peak * 1024
+
+
+# --- Cases ---
+# Each runs inside the child process, after it has changed into its own
+# working directory, and returns per-iteration latencies and bytes processed.
+
+def _bench_dir_checksum(case: Case, fixtures: Dict[str, Any]) -> _Samples:
+  from app import calculate_dir_checksum
+
+  chapters_dir = fixtures["chapters_dir"]
+  nbytes = sum(entry.stat().st_size for entry in os.scandir(chapters_dir))
+  calculate_dir_checksum(chapters_dir) # Warm the page cache
+  samples = []
+  for _ in range(case.iterations):
+    started = time.perf_counter()
+    calculate_dir_checksum(chapters_dir)
+    samples.append(time.perf_counter() - started)
+  return samples, nbytes
+
+
+def _bench_extract_validate(case: Case, fixtures: Dict[str, Any]) -> _Samples:
+  from pathlib import Path as PyPath
+  from app.routes.books import _extract_and_validate_tar
+
+  book_path = PyPath(fixtures["books"][0])
+  extract_root = PyPath("extract").resolve()
+
+  async def run() -> List[float]:
+    samples = []
+    for i in range(case.iterations + 1):
+      target = extract_root / str(i)
+      started = time.perf_counter()
+      await _extract_and_validate_tar(book_path, target)
+      elapsed = time.perf_counter() - started
+      await asyncio.to_thread(shutil.rmtree, target)
+      if i: # The first iteration warms imports and the page cache
+        samples.append(elapsed)
+    return samples
+
+  return asyncio.run(run()), book_path.stat().st_size
+
+
+def _bench_upload(case: Case, fixtures: Dict[str, Any]) -> _Samples:
+  import httpx
+  from fastapi import FastAPI
+  from app.routes.books import books_router, load_index, catalog_ready
+
+  # Only the books router: the database and background services are not on this path.
+  application = FastAPI()
+  application.include_router(books_router)
+  books = fixtures["books"][:case.iterations + 1]
+  if case.catalog_entries:
+    shutil.copyfile(fixtures["catalogs"][str(case.catalog_entries)], "index.json")
+
+  async def run() -> List[float]:
+    await load_index()
+    catalog_ready.set()
+    for handler in application.router.on_startup:
+      await handler()
+    samples = []
+    transport = httpx.ASGITransport(app=application)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+      for i, book_path in enumerate(books):
+        with open(book_path, "rb") as f:
+          content = f.read()
+        started = time.perf_counter()
+        response = await client.post("/books/upload", files={"file": (os.path.basename(book_path), content)})
+        elapsed = time.perf_counter() - started
+        if response.status_code != 201:
+          raise RuntimeError(f"Upload of {book_path} failed: {response.status_code} {response.text}")
+        if i:
+          samples.append(elapsed)
+    return samples
+
+  return asyncio.run(run()), os.path.getsize(books[0])
+
+
+def _bench_save_index(case: Case, fixtures: Dict[str, Any]) -> _Samples:
+  from app.routes.books import load_index, save_index, _INDEX_FILE_PATH
+
+  shutil.copyfile(fixtures["catalogs"][str(case.catalog_entries)], _INDEX_FILE_PATH)
+
+  async def run() -> List[float]:
+    await load_index()
+    samples = []
+    for _ in range(case.iterations):
+      started = time.perf_counter()
+      await save_index()
+      samples.append(time.perf_counter() - started)
+    return samples
+
+  samples = asyncio.run(run())
+  return samples, os.path.getsize(_INDEX_FILE_PATH)
+
+
+def _bench_load_index(case: Case, fixtures: Dict[str, Any]) -> _Samples:
+  from app.routes.books import load_index, _INDEX_FILE_PATH
+
+  shutil.copyfile(fixtures["catalogs"][str(case.catalog_entries)], _INDEX_FILE_PATH)
+
+  async def run() -> List[float]:
+    samples = []
+    for _ in range(case.iterations):
+      started = time.perf_counter()
+      await load_index()
+      samples.append(time.perf_counter() - started)
+    return samples
+
+  return asyncio.run(run()), os.path.getsize(_INDEX_FILE_PATH)
+
+
+def _bench_get_book_index(case: Case, fixtures: Dict[str, Any]) -> _Samples:
+  from app.routes.books import load_index, get_book_index, catalog_ready, _INDEX_FILE_PATH
+
+  shutil.copyfile(fixtures["catalogs"][str(case.catalog_entries)], _INDEX_FILE_PATH)
+
+  async def run() -> _Samples:
+    await load_index()
+    catalog_ready.set()
+    samples = []
+    nbytes = 0
+    for _ in range(case.iterations):
+      started = time.perf_counter()
+      response = await get_book_index()
+      samples.append(time.perf_counter() - started)
+      nbytes = len(response.body)
+    return samples, nbytes
+
+  return asyncio.run(run())
+
+
+CASES: Dict[str, Callable[[Case, Dict[str, Any]], _Samples]] = {
+  "dir_checksum": _bench_dir_checksum,
+  "extract_validate": _bench_extract_validate,
+  "upload": _bench_upload,
+  "save_index": _bench_save_index,
+  "load_index": _bench_load_index,
+  "get_book_index": _bench_get_book_index,
+}
+
+
+def _run_case(case: Case, fixtures: Dict[str, Any], results) -> None:
+  """Entry point of the child process running a single case."""
+  workdir = tempfile.mkdtemp(prefix="bench_", dir=fixtures["root"])
+  os.chdir(workdir)
+  try:
+    logging.getLogger("methodos-operator").setLevel(logging.WARNING)
+    samples, nbytes = CASES[case.kind](case, fixtures)
+    results.put((case.name, summarize(samples, nbytes, _peak_rss()), None))
+  except Exception as e:
+    results.put((case.name, None, f"{type(e).__name__}: {e}"))
+  finally:
+    os.chdir(fixtures["root"])
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_isolated(case: Case, fixtures: Dict[str, Any]) -> Dict[str, float]:
+  context = multiprocessing.get_context("spawn")
+  results = context.Queue()
+  process = context.Process(target=_run_case, args=(case, fixtures, results), name=case.name)
+  process.start()
+  name, summary, error = results.get()
+  process.join()
+  if error is not None:
+    raise RuntimeError(f"{name} failed: {error}")
+  return summary
+
+
+# --- Fixtures ---
+
+def build_fixtures(root: str, args: argparse.Namespace, kinds: List[str]) -> Dict[str, Any]:
+  fixtures: Dict[str, Any] = {"root": root, "catalogs": {}}
+  book_count = args.iterations + 1
+  books = []
+  for i in range(book_count if "upload" in kinds else 1):
+    path = os.path.join(root, f"synthetic-bench.{i}.book")
+    write_book(path, version=f"bench.{i}", chapters=args.chapters, chapter_size=args.chapter_size, seed=args.seed + i, workdir=root)
+    books.append(path)
+  fixtures["books"] = books
+
+  extracted = os.path.join(root, "extracted")
+  with tarfile.open(books[0], "r:gz") as tar:
+    tar.extractall(extracted)
+  fixtures["chapters_dir"] = os.path.join(extracted, "chapters")
+
+  if any(kind in kinds for kind in ("upload", "save_index", "load_index", "get_book_index")):
+    sizes = set(args.catalog_sizes) | ({args.upload_catalog} if "upload" in kinds and args.upload_catalog else set())
+    for size in sorted(sizes):
+      path = os.path.join(root, f"catalog-{size}.json")
+      started = time.perf_counter()
+      write_catalog(path, size, args.seed)
+      print(f"  generated {size:,} entry catalog ({os.path.getsize(path) / 2**20:.1f} MiB) in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+      fixtures["catalogs"][str(size)] = path
+  return fixtures
+
+
+def plan(args: argparse.Namespace, kinds: List[str]) -> List[Case]:
+  chapters = f"{args.chapters}x{args.chapter_size // 1024}KiB" if args.chapter_size >= 1024 else f"{args.chapters}x{args.chapter_size}B"
+  cases = []
+  for kind in kinds:
+    if kind in ("dir_checksum", "extract_validate"):
+      cases.append(Case(kind, chapters, args.iterations))
+    elif kind == "upload":
+      cases.append(Case(kind, f"{chapters},catalog={args.upload_catalog}", args.iterations, args.upload_catalog))
+    else:
+      for size in args.catalog_sizes:
+        # Keep the largest catalogs to a handful of runs.
+        iterations = max(3, min(args.iterations, 2_000_000 // size))
+        cases.append(Case(kind, str(size), iterations, size))
+  return cases
+
+
+# --- Reporting ---
+
+def compare(current: Dict[str, float], baseline: Optional[Dict[str, float]], tolerance: float) -> Tuple[str, bool]:
+  if baseline is None:
+    return "", False
+  latency = current["p50_ms"] / baseline["p50_ms"] - 1 if baseline["p50_ms"] else 0.0
+  rss = current["peak_rss_mib"] / baseline["peak_rss_mib"] - 1 if baseline["peak_rss_mib"] else 0.0
+  regressed = latency > tolerance or rss > tolerance
+  return f"p50 {latency:+.1%} rss {rss:+.1%}{'  REGRESSION' if regressed else ''}", regressed
+
+
+def _git_revision() -> Optional[str]:
+  try:
+    return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--only", default=",".join(CASES), help=f"Comma-separated subset of: {', '.join(CASES)}")
+  parser.add_argument("--catalog-sizes", default="1000,10000,100000", help="Index entries for the catalog cases, e.g. 1000,1000000")
+  parser.add_argument("--upload-catalog", type=int, default=1000, help="Index entries present while uploading")
+  parser.add_argument("--chapters", type=int, default=50)
+  parser.add_argument("--chapter-size", type=int, default=16384, help="Bytes per chapter")
+  parser.add_argument("--iterations", type=int, default=20)
+  parser.add_argument("--seed", type=int, default=0)
+  parser.add_argument("--dir", default=None, help="Where to generate inputs (default: system temp dir)")
+  parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline results to compare against")
+  parser.add_argument("--save-baseline", action="store_true", help="Store this run's results as the baseline")
+  parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed growth of p50 latency and peak RSS")
+  parser.add_argument("--output", default=None, help="Also write this run's results as JSON")
+  args = parser.parse_args()
+  args.catalog_sizes = [int(size) for size in args.catalog_sizes.split(",") if size]
+
+  kinds = [kind for kind in args.only.split(",") if kind]
+  unknown = [kind for kind in kinds if kind not in CASES]
+  if unknown:
+    parser.error(f"unknown cases: {', '.join(unknown)}")
+
+  baseline: Dict[str, Dict[str, float]] = {}
+  if os.path.exists(args.baseline) and not args.save_baseline:
+    with open(args.baseline) as f:
+      baseline = json.load(f)["results"]
+
+  results: Dict[str, Dict[str, float]] = {}
+  regressions = []
+  with tempfile.TemporaryDirectory(prefix="methodos-bench-", dir=args.dir) as root:
+    print("Generating inputs...", file=sys.stderr)
+    fixtures = build_fixtures(root, args, kinds)
+
+    print(f"{'case':<44}{'iters':>6}{'ops/s':>10}{'MB/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'RSS MiB':>9}")
+    for case in plan(args, kinds):
+      summary = run_isolated(case, fixtures)
+      results[case.name] = summary
+      delta, regressed = compare(summary, baseline.get(case.name), args.tolerance)
+      if regressed:
+        regressions.append(case.name)
+      print(
+        f"{case.name:<44}{summary['iterations']:>6}{summary['ops_per_sec']:>10.1f}{summary['mb_per_sec']:>9.1f}"
+        f"{summary['p50_ms']:>10.2f}{summary['p95_ms']:>10.2f}{summary['p99_ms']:>10.2f}{summary['peak_rss_mib']:>9.1f}  {delta}",
+        flush=True,
+      )
+
+  report = {
+    "meta": {
+      "revision": _git_revision(),
+      "python": platform.python_version(),
+      "platform": platform.platform(),
+      "cpus": os.cpu_count(),
+      "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    },
+    "results": results,
+  }
+  if args.output:
+    with open(args.output, "w") as f:
+      json.dump(report, f, indent=2)
+  if args.save_baseline:
+    # Keep baselines of cases that were not run this time.
+    if os.path.exists(args.baseline):
+      with open(args.baseline) as f:
+        report["results"] = {**json.load(f)["results"], **results}
+    with open(args.baseline, "w") as f:
+      json.dump(report, f, indent=2)
+    print(f"Baseline saved to {args.baseline}")
+
+  if regressions:
+    print(f"{len(regressions)} regression(s) against {args.baseline}: {', '.join(regressions)}")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+  main()
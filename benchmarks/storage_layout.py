@@ -0,0 +1,70 @@
+"""
+Compares the flat and hash-sharded BOOKS_DIR layouts: time to create N empty
+.book files, to look up random ones, and to list the whole directory tree.
+
+Usage: python -m benchmarks.storage_layout --files 1000000 [--dir /mnt/books-bench]
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+
+from pathlib import Path as PyPath
+
+from app.services.storage import BookStorage
+
+
+def bench_layout(root: PyPath, names, sharded: bool, lookups: int) -> dict:
+  storage = BookStorage(str(root))
+  path_for = storage.path_for if sharded else storage.flat_path
+  root.mkdir(parents=True, exist_ok=True)
+
+  started = time.perf_counter()
+  for name in names:
+    path = path_for(name)
+    try:
+      fd = os.open(path, os.O_CREAT | os.O_WRONLY, 0o644)
+    except FileNotFoundError:
+      path.parent.mkdir(parents=True, exist_ok=True)
+      fd = os.open(path, os.O_CREAT | os.O_WRONLY, 0o644)
+    os.close(fd)
+  create = time.perf_counter() - started
+
+  sample = random.Random(1).sample(names, min(lookups, len(names)))
+  started = time.perf_counter()
+  for name in sample:
+    storage.locate(name) if sharded else path_for(name).is_file()
+  lookup = time.perf_counter() - started
+
+  started = time.perf_counter()
+  listed = len(storage.scan())
+  listing = time.perf_counter() - started
+
+  return {
+    "create_per_sec": len(names) / create,
+    "lookup_us": lookup / len(sample) * 1e6,
+    "list_sec": listing,
+    "listed": listed,
+  }
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--files", type=int, default=1_000_000)
+  parser.add_argument("--lookups", type=int, default=100_000)
+  parser.add_argument("--dir", default=None, help="Directory to benchmark in (defaults to a temporary directory); use the filesystem BOOKS_DIR lives on.")
+  args = parser.parse_args()
+
+  names = [f"book-{i}-1.0.{i % 10}.book" for i in range(args.files)]
+  with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+    for label, sharded in (("flat", False), ("sharded", True)):
+      result = bench_layout(PyPath(tmp) / label, names, sharded, args.lookups)
+      print(
+        f"{label:8} files={result['listed']:>10,}  create={result['create_per_sec']:>10,.0f}/s  "
+        f"lookup={result['lookup_us']:>7.1f}us  list={result['list_sec']:>7.2f}s"
+      )
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,152 @@
+"""
+Synthetic inputs for the benchmarks: .book packages with a chosen number and
+size of chapters, and index files with any number of catalog entries.
+
+Usage: python -m benchmarks.synthetic book out.book --chapters 50 --chapter-size 16384
+       python -m benchmarks.synthetic catalog index.json --entries 1000000
+"""
+import os
+import io
+import json
+import random
+import shutil
+import hashlib
+import tarfile
+import argparse
+import tempfile
+
+from pathlib import Path as PyPath
+from typing import Iterable, Optional
+
+from app import calculate_dir_checksum
+from app.enums.books import Architecture, Platform
+
+
+def synthetic_entry(i: int, rng: random.Random) -> dict:
+  """An index entry as `upload_book` writes it. Keys `book-<i % 5000>-<version>` are unique per `i`."""
+  name = f"book-{i % 5000}"
+  version = f"{i // 5000}.{i % 7}.{i % 3}"
+  return {
+    "name": name,
+    "version": version,
+    "description": f"Configures {name} for the fleet. " * rng.randint(2, 8),
+    "checksum_algorithm": "sha256",
+    "checksum": hashlib.sha256(f"chapters-{i}".encode()).hexdigest(),
+    "author": "Team Imperium",
+    "dependencies": [{"name": f"book-{rng.randrange(5000)}", "version": "1.0.0"} for _ in range(rng.randint(0, 4))],
+    "tags": ["baseline", "hardening"][: rng.randint(0, 2)],
+    "license": "MIT",
+    "supported_architectures": [a.value for a in rng.sample(list(Architecture), 3)],
+    "supported_platforms": [p.value for p in rng.sample(list(Platform), 6)],
+    "variables": {f"var_{k}": f"value-{k}" for k in range(rng.randint(2, 12))},
+    "book_filename": f"{name}-{version}.book",
+    "book_checksum_algo": "sha256",
+    "book_checksum": hashlib.sha256(f"book-{i}".encode()).hexdigest(),
+    "book_upload_timestamp": "2025-01-01T00:00:00",
+  }
+
+
+def write_catalog(path: str, entries: int, seed: int = 0) -> None:
+  """
+  Streams `entries` synthetic entries to `path` in the one-entry-per-line
+  layout written by `Catalog.save`, so even a 1M entry index is generated
+  without holding it in memory and loads without a conversion pass.
+  """
+  rng = random.Random(seed)
+  with open(path, "wb") as f:
+    f.write(b"{\n")
+    for i in range(entries):
+      entry = synthetic_entry(i, rng)
+      line = json.dumps(f"{entry['name']}-{entry['version']}") + ": " + json.dumps(entry, separators=(",", ":"))
+      f.write(line.encode("utf-8") + (b",\n" if i < entries - 1 else b"\n"))
+    f.write(b"}\n")
+
+
+def _chapter_text(rng: random.Random, size: int) -> bytes:
+  # Config-like lines: compresses about as well as real chapters, unlike random bytes.
+  lines = []
+  written = 0
+  while written < size:
+    line = f"setting_{rng.randrange(10_000)} = {rng.getrandbits(64):016x}\n"
+    lines.append(line)
+    written += len(line)
+  return "".join(lines).encode("utf-8")[:size]
+
+
+def write_book(
+    path: str,
+    name: str = "synthetic",
+    version: str = "1.0.0",
+    chapters: int = 10,
+    chapter_size: int = 4096,
+    seed: int = 0,
+    checksum_algorithm: str = "sha256",
+    workdir: Optional[str] = None,
+    platforms: Optional[Iterable[Platform]] = None,
+    architectures: Optional[Iterable[Architecture]] = None,
+) -> str:
+  """
+  Writes a valid .book package (gzipped tar of metadata.json and chapters/)
+  whose metadata checksum matches its chapters. Returns the chapters checksum.
+  Supported platforms and architectures are a random sample unless given.
+  """
+  rng = random.Random(seed)
+  staging = PyPath(tempfile.mkdtemp(prefix="book_", dir=workdir))
+  try:
+    chapters_dir = staging / "chapters"
+    chapters_dir.mkdir()
+    for i in range(chapters):
+      (chapters_dir / f"{i:04d}-chapter.conf").write_bytes(_chapter_text(rng, chapter_size))
+
+    checksum = calculate_dir_checksum(str(chapters_dir), checksum_algorithm)
+    metadata = {
+      "name": name,
+      "version": version,
+      "description": f"Synthetic book with {chapters} chapters of {chapter_size} bytes.",
+      "checksum_algorithm": checksum_algorithm,
+      "checksum": checksum,
+      "author": "Team Imperium",
+      "dependencies": [],
+      "tags": ["synthetic"],
+      "license": "MIT",
+      "supported_architectures": [a.value for a in (architectures or rng.sample(list(Architecture), 3))],
+      "supported_platforms": [p.value for p in (platforms or rng.sample(list(Platform), 6))],
+      "variables": {f"var_{k}": f"value-{k}" for k in range(8)},
+    }
+    metadata_bytes = json.dumps(metadata, indent=2).encode("utf-8")
+
+    with tarfile.open(path, "w:gz") as tar:
+      info = tarfile.TarInfo("metadata.json")
+      info.size = len(metadata_bytes)
+      tar.addfile(info, io.BytesIO(metadata_bytes))
+      tar.add(chapters_dir, arcname="chapters")
+    return checksum
+  finally:
+    shutil.rmtree(staging, ignore_errors=True)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  subcommands = parser.add_subparsers(dest="command", required=True)
+  book_parser = subcommands.add_parser("book", help="Write a synthetic .book package.")
+  book_parser.add_argument("path")
+  book_parser.add_argument("--name", default="synthetic")
+  book_parser.add_argument("--version", default="1.0.0")
+  book_parser.add_argument("--chapters", type=int, default=10)
+  book_parser.add_argument("--chapter-size", type=int, default=4096)
+  book_parser.add_argument("--seed", type=int, default=0)
+  catalog_parser = subcommands.add_parser("catalog", help="Write a synthetic index.json.")
+  catalog_parser.add_argument("path")
+  catalog_parser.add_argument("--entries", type=int, default=1000)
+  catalog_parser.add_argument("--seed", type=int, default=0)
+  args = parser.parse_args()
+
+  if args.command == "book":
+    write_book(args.path, args.name, args.version, args.chapters, args.chapter_size, args.seed)
+  else:
+    write_catalog(args.path, args.entries, args.seed)
+  print(f"Wrote {args.path} ({os.path.getsize(args.path):,} bytes)")
+
+
+if __name__ == "__main__":
+  main()
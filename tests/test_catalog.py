@@ -0,0 +1,203 @@
+import json
+import multiprocessing
+
+from app.services.catalog import Catalog
+
+
+def make_entry(name: str, version: str = "1.0.0", **extra) -> dict:
+  entry = {
+    "name": name,
+    "version": version,
+    "description": f"Configures {name}.",
+    "checksum_algorithm": "sha256",
+    "checksum": "0" * 64,
+    "author": "Team Imperium",
+    "supported_architectures": ["x86_64", "arm64"],
+    "supported_platforms": ["Ubuntu 22.04", "Red Hat 9"],
+    "variables": {"port": 8080},
+    "book_filename": f"{name}-{version}.book",
+    "book_checksum_algo": "sha256",
+    "book_checksum": "f" * 64,
+    "book_upload_timestamp": "2025-01-01T00:00:00+00:00",
+  }
+  entry.update(extra)
+  return entry
+
+
+def make_catalog(entries: dict) -> Catalog:
+  catalog = Catalog()
+  for book_key, entry in entries.items():
+    catalog.add(book_key, entry)
+  return catalog
+
+
+def loaded(path) -> Catalog:
+  catalog = Catalog()
+  catalog.load(path)
+  return catalog
+
+
+def test_save_load_round_trip(tmp_path):
+  entries = {f"book-{i}-1.0.0": make_entry(f"book-{i}") for i in range(50)}
+  path = tmp_path / "index.json"
+  make_catalog(entries).save(path)
+
+  catalog = loaded(path)
+  assert list(catalog.keys()) == list(entries)
+  for book_key, entry in entries.items():
+    record = catalog.get(book_key)
+    assert record.to_dict() == entry
+    assert record.filename == entry["book_filename"]
+    assert record.checksum == entry["book_checksum"]
+    assert record.supports(platform="Ubuntu 22.04", architecture="arm64")
+    assert not record.supports(platform="Debian 12")
+
+  # Saving a loaded catalog writes the same file again.
+  before = path.read_bytes()
+  catalog.save(path)
+  assert path.read_bytes() == before
+
+
+def test_save_writes_one_entry_per_line(tmp_path):
+  entries = {"a-1.0.0": make_entry("a"), "b-1.0.0": make_entry("b")}
+  path = tmp_path / "index.json"
+  make_catalog(entries).save(path)
+
+  lines = path.read_bytes().split(b"\n")
+  assert lines[0] == b"{" and lines[-2] == b"}"
+  assert len(lines) == len(entries) + 3 # braces and the trailing newline
+  assert json.loads(path.read_bytes()) == entries
+
+
+def test_non_ascii_keys_and_values(tmp_path):
+  entries = {
+    "книга-1.0.0": make_entry("книга", description="Настройка сервера"),
+    "書籍-2.0.0": make_entry("書籍", "2.0.0", variables={"motd": "ようこそ 🚀"}),
+    "plain-1.0.0": make_entry("plain"),
+  }
+  path = tmp_path / "index.json"
+  make_catalog(entries).save(path)
+
+  catalog = loaded(path)
+  assert set(catalog.keys()) == set(entries)
+  for book_key, entry in entries.items():
+    assert catalog.get(book_key).to_dict() == entry
+
+
+def test_converts_pretty_printed_index(tmp_path):
+  entries = {
+    "a-1.0.0": make_entry("a"),
+    "ü-1.0.0": make_entry("ü"),
+  }
+  path = tmp_path / "index.json"
+  path.write_text(json.dumps(entries, indent=2))
+
+  catalog = loaded(path)
+  assert {key: record.to_dict() for key, record in catalog.items()} == entries
+
+  # The file was rewritten in the line layout and loads without conversion.
+  assert path.read_bytes().startswith(b"{\n")
+  assert json.loads(path.read_bytes()) == entries
+  converted = path.read_bytes()
+  assert {key: record.to_dict() for key, record in loaded(path).items()} == entries
+  assert path.read_bytes() == converted
+
+
+def test_empty_index(tmp_path):
+  path = tmp_path / "index.json"
+  assert len(loaded(path)) == 0 # Missing file
+
+  path.write_bytes(b"")
+  assert len(loaded(path)) == 0
+
+  Catalog().save(path)
+  assert json.loads(path.read_bytes()) == {}
+  catalog = loaded(path)
+  assert len(catalog) == 0
+  assert catalog.to_json_bytes() == b"{}"
+
+  path.write_text("{}")
+  assert len(loaded(path)) == 0
+
+
+def test_to_json_bytes_matches_json_dumps(tmp_path):
+  entries = {f"book-{i}-1.0.0": make_entry(f"book-{i}") for i in range(5)}
+  entries["ñandú-1.0.0"] = make_entry("ñandú")
+  catalog = make_catalog(entries)
+  expected = json.dumps(entries, separators=(",", ":")).encode("utf-8")
+  assert catalog.to_json_bytes() == expected
+
+  path = tmp_path / "index.json"
+  catalog.save(path)
+  reloaded = loaded(path)
+  parsed = {key: record.to_dict() for key, record in reloaded.items()}
+  assert reloaded.to_json_bytes() == json.dumps(parsed, separators=(",", ":")).encode("utf-8")
+  assert json.loads(reloaded.to_json_bytes()) == entries
+
+
+def test_add_and_pop_after_load(tmp_path):
+  path = tmp_path / "index.json"
+  make_catalog({"a-1.0.0": make_entry("a")}).save(path)
+
+  catalog = loaded(path)
+  catalog.add("b-1.0.0", make_entry("b"))
+  assert catalog.pop("a-1.0.0") is not None
+  catalog.save(path)
+
+  assert json.loads(path.read_bytes()) == {"b-1.0.0": make_entry("b")}
+  assert list(loaded(path).keys()) == ["b-1.0.0"]
+
+
+def _save_repeatedly(path, prefix, saves, barrier):
+  catalog = make_catalog({f"{prefix}-{i}-1.0.0": make_entry(f"{prefix}-{i}") for i in range(200)})
+  barrier.wait()
+  for _ in range(saves):
+    catalog.save(path)
+
+
+def test_concurrent_saves_from_two_processes(tmp_path):
+  path = tmp_path / "index.json"
+  context = multiprocessing.get_context("fork")
+  barrier = context.Barrier(2)
+  workers = [context.Process(target=_save_repeatedly, args=(path, prefix, 20, barrier)) for prefix in ("a", "b")]
+  for worker in workers:
+    worker.start()
+  for worker in workers:
+    worker.join(timeout=60)
+  assert [worker.exitcode for worker in workers] == [0, 0]
+
+  # The last save wins whole; neither writer's file is torn or left behind.
+  keys = {key.split("-")[0] for key in json.loads(path.read_bytes())}
+  assert keys in ({"a"}, {"b"})
+  assert len(loaded(path)) == 200
+  assert sorted(p.name for p in tmp_path.iterdir()) == ["index.json", "index.json.lock"]
+
+
+def test_remove_saved_keeps_entries_saved_by_others(tmp_path):
+  path = tmp_path / "index.json"
+  make_catalog({"a-1.0.0": make_entry("a"), "b-1.0.0": make_entry("b")}).save(path)
+  stale = loaded(path)
+
+  # Another worker uploads a book after `stale` was loaded.
+  other = loaded(path)
+  other.add("c-1.0.0", make_entry("c"))
+  other.save(path)
+
+  assert stale.remove_saved(path, "a-1.0.0").name == "a"
+  assert list(stale.keys()) == ["b-1.0.0", "c-1.0.0"]
+  assert list(loaded(path).keys()) == ["b-1.0.0", "c-1.0.0"]
+  assert stale.remove_saved(path, "missing-1.0.0") is None
+
+
+def test_remove_saved_leaves_catalog_unchanged_on_error(tmp_path):
+  path = tmp_path / "index.json"
+  catalog = make_catalog({"a-1.0.0": make_entry("a")})
+  path.write_text("{not json")
+  try:
+    catalog.remove_saved(path, "a-1.0.0")
+  except ValueError:
+    pass
+  else:
+    raise AssertionError("corrupt index was overwritten")
+  assert list(catalog.keys()) == ["a-1.0.0"]
+  assert path.read_text() == "{not json"
@@ -0,0 +1,120 @@
+import asyncio
+import uuid
+
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, select
+
+from app.enums import Mode, State, Type
+from app.models.agent import MethodosAgent
+from app.models.sql import Agent
+from app.services import heartbeats
+from app.services.heartbeats import HeartbeatWriter
+
+
+def make_agent(agent_uuid: uuid.UUID, uptime: int = 0, state: State = State.ACTIVE) -> MethodosAgent:
+  return MethodosAgent(
+    fqdn=f"host-{agent_uuid.hex[:8]}.example.com",
+    uuid=agent_uuid,
+    type=Type.HOST,
+    state=state,
+    mode=Mode.ENFORCING,
+    version="1.0.0",
+    uptime=uptime,
+    cert=b"",
+  )
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+  engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'agents.db'}")
+
+  async def create_schema():
+    async with engine.begin() as connection:
+      await connection.run_sync(SQLModel.metadata.create_all)
+
+  asyncio.run(create_schema())
+  monkeypatch.setattr(heartbeats, "engine", engine)
+  yield engine
+  asyncio.run(engine.dispose())
+
+
+def stored(engine):
+  async def query():
+    async with engine.connect() as connection:
+      rows = (await connection.execute(select(Agent.uuid, Agent.uptime, Agent.state))).all()
+    return {row.uuid: (row.uptime, row.state) for row in rows}
+  return asyncio.run(query())
+
+
+def test_repeated_check_ins_merge_into_one_row(engine):
+  writer = HeartbeatWriter(batch_size=100)
+  agents = [uuid.uuid4() for _ in range(3)]
+  for uptime in range(5):
+    for agent_uuid in agents:
+      writer.record(make_agent(agent_uuid, uptime=uptime))
+  assert writer.pending == 3
+
+  assert asyncio.run(writer.flush()) == 3
+  assert writer.pending == 0
+  assert stored(engine) == {agent_uuid: (4, "active") for agent_uuid in agents}
+
+  writer.record(make_agent(agents[0], uptime=10, state=State.INACTIVE))
+  assert asyncio.run(writer.flush()) == 1
+  assert stored(engine)[agents[0]] == (10, "inactive")
+
+
+def test_new_agents_are_dropped_once_max_pending_is_reached(engine):
+  writer = HeartbeatWriter(batch_size=100, max_pending=2)
+  first, second, third = (uuid.uuid4() for _ in range(3))
+  writer.record(make_agent(first))
+  writer.record(make_agent(second))
+  writer.record(make_agent(third))
+  assert writer.pending == 2
+  assert writer.dropped == 1
+  # A dropped agent's state is still known in memory, just not queued for writing.
+  assert writer.get(third) is not None
+
+  # Agents already pending keep being updated.
+  writer.record(make_agent(first, uptime=7))
+  assert writer.dropped == 1
+  asyncio.run(writer.flush())
+  assert stored(engine) == {first: (7, "active"), second: (0, "active")}
+
+
+def test_failed_flush_keeps_newer_heartbeats(engine, monkeypatch):
+  writer = HeartbeatWriter(batch_size=100)
+  agent_uuid, other_uuid = uuid.uuid4(), uuid.uuid4()
+  writer.record(make_agent(agent_uuid, uptime=1))
+  writer.record(make_agent(other_uuid, uptime=1))
+
+  async def failing_upsert(rows):
+    # A newer check-in arrives while the batch is being written.
+    writer.record(make_agent(agent_uuid, uptime=2))
+    raise RuntimeError("database unavailable")
+
+  monkeypatch.setattr(heartbeats, "_upsert_heartbeats", failing_upsert)
+  with pytest.raises(RuntimeError):
+    asyncio.run(writer.flush())
+  assert writer.pending == 2
+  assert writer.get(agent_uuid).uptime == 2
+
+  monkeypatch.undo()
+  monkeypatch.setattr(heartbeats, "engine", engine)
+  assert asyncio.run(writer.flush()) == 2
+  assert stored(engine) == {agent_uuid: (2, "active"), other_uuid: (1, "active")}
+
+
+def test_stop_flushes_pending_heartbeats(engine):
+  writer = HeartbeatWriter(flush_interval=3600, batch_size=100)
+  agents = [uuid.uuid4() for _ in range(5)]
+
+  async def run():
+    writer.start()
+    for agent_uuid in agents:
+      writer.record(make_agent(agent_uuid, uptime=3))
+    await writer.stop()
+
+  asyncio.run(run())
+  assert writer.pending == 0
+  assert stored(engine) == {agent_uuid: (3, "active") for agent_uuid in agents}
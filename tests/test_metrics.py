@@ -0,0 +1,56 @@
+import os
+import json
+import time
+import asyncio
+import subprocess
+import sys
+
+from app.services.metrics import Registry, WorkerSnapshots, registry
+
+
+def test_every_series_has_a_pid_label():
+  metrics = Registry()
+  metrics.counter("requests_total", "Requests.", ("route",)).inc("/books")
+  metrics.gauge("books", "Books.", callback=lambda: 3)
+  metrics.histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0)).observe(0.5)
+
+  pid = f'pid="{os.getpid()}"'
+  samples = [line for line in metrics.render().splitlines() if not line.startswith("#")]
+  assert samples
+  assert all(line.split("{", 1)[1].startswith(pid) for line in samples)
+  assert f'requests_total{{{pid},route="/books"}} 1' in samples
+  assert f'latency_seconds_bucket{{{pid},le="1.0"}} 1' in samples
+
+
+def test_render_groups_peer_samples_under_each_metric():
+  metrics = Registry()
+  metrics.counter("a_total", "A.").inc()
+  metrics.counter("b_total", "B.").inc()
+  peer = {"a_total": ['a_total{pid="1"} 5'], "b_total": ['b_total{pid="1"} 7']}
+
+  lines = metrics.render([peer]).splitlines()
+  # All samples of a metric follow its header, as the exposition format requires.
+  assert lines.index('a_total{pid="1"} 5') < lines.index("# HELP b_total B.")
+  assert lines[-1] == 'b_total{pid="1"} 7'
+
+
+def test_snapshots_serve_live_workers_only(tmp_path):
+  snapshots = WorkerSnapshots(str(tmp_path), interval=60)
+  exited = subprocess.Popen([sys.executable, "-c", "pass"])
+  exited.wait()
+  live = os.getppid()
+  (tmp_path / f"{exited.pid}.json").write_text(json.dumps({"methodos_thread_pool_queue_depth": ["dead"]}))
+  (tmp_path / f"{live}.json").write_text(json.dumps({"methodos_thread_pool_queue_depth": [f'methodos_thread_pool_queue_depth{{pid="{live}"}} 2']}))
+  stale = tmp_path / "1.json"
+  stale.write_text(json.dumps({"methodos_thread_pool_queue_depth": ["stale"]}))
+  os.utime(stale, (time.time() - 600, time.time() - 600))
+
+  text = asyncio.run(snapshots.render())
+  assert f'methodos_thread_pool_queue_depth{{pid="{live}"}} 2' in text
+  assert f'methodos_thread_pool_queue_depth{{pid="{os.getpid()}"}}' in text
+  assert "dead" not in text and "stale" not in text
+  assert not (tmp_path / f"{exited.pid}.json").exists()
+  assert json.loads((tmp_path / f"{os.getpid()}.json").read_text()) == registry.samples()
+
+  asyncio.run(snapshots.stop())
+  assert not (tmp_path / f"{os.getpid()}.json").exists()
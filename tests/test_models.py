@@ -0,0 +1,46 @@
+import pytest
+
+from pydantic import ValidationError
+
+from app.models.books import Metadata
+
+
+def metadata(**overrides) -> dict:
+  data = {
+    "name": "nginx",
+    "version": "1.2.0",
+    "description": "Configures nginx.",
+    "checksum_algorithm": "sha256",
+    "checksum": "0" * 64,
+    "author": "Team Imperium",
+    "supported_architectures": ["x86_64"],
+    "supported_platforms": ["Ubuntu 22.04"],
+  }
+  data.update(overrides)
+  return data
+
+
+@pytest.mark.parametrize("name, version", [
+  ("nginx", "1.2.0"),
+  ("web_server-base", "2.0.0-rc.1"),
+  ("openssl", "3.0.13+fips"),
+])
+def test_accepts_safe_names_and_versions(name, version):
+  assert Metadata(**metadata(name=name, version=version)).name == name
+
+
+@pytest.mark.parametrize("field, value", [
+  ("name", "../../../../tmp/e2e/pwned"),
+  ("name", "a/b"),
+  ("name", "a\\b"),
+  ("name", ".."),
+  ("name", "a..b"),
+  ("name", ".hidden"),
+  ("name", ""),
+  ("version", "1.0/../../x"),
+  ("version", "1.0."),
+  ("version", "1 0"),
+])
+def test_rejects_unsafe_names_and_versions(field, value):
+  with pytest.raises(ValidationError):
+    Metadata(**metadata(**{field: value}))
@@ -0,0 +1,66 @@
+import io
+import asyncio
+import tarfile
+
+import pytest
+from fastapi import HTTPException
+
+from app.services.render import BookRenderer, LRUCache
+
+
+def write_book(path, chapters: dict) -> None:
+  with tarfile.open(path, "w:gz") as tar:
+    for name, source in chapters.items():
+      data = source.encode("utf-8")
+      info = tarfile.TarInfo(f"chapters/{name}")
+      info.size = len(data)
+      tar.addfile(info, io.BytesIO(data))
+
+
+def test_lru_cache_is_bounded_by_weight():
+  cache = LRUCache(maxsize=100, maxweight=10, weigh=len)
+  cache.put("a", "xxxx")
+  cache.put("b", "xxxx")
+  cache.put("c", "xxxx")
+  assert cache.get("a") is None
+  assert cache.weight == 8 and len(cache) == 2
+
+  cache.put("big", "x" * 11)
+  assert cache.get("big") is None
+  assert cache.weight == 8
+
+  cache.put("b", "x")
+  assert cache.weight == 5
+
+
+def test_rendered_books_are_memoized_within_the_byte_budget(tmp_path):
+  book_path = tmp_path / "big.book"
+  write_book(book_path, {"main.conf": "{{ value }}" * 1000})
+  renderer = BookRenderer(output_cache_bytes=50_000)
+
+  for i in range(20):
+    asyncio.run(renderer.render("big-1.0.0", book_path, {"value": f"{i:08d}"}))
+  assert 0 < renderer.outputs.weight <= 50_000
+  assert len(renderer.outputs) < 20
+
+  # A single book larger than the whole budget is not memoized at all.
+  digest, rendered = asyncio.run(renderer.render("big-1.0.0", book_path, {"value": "x" * 100}))
+  assert len(rendered["main.conf"]) == 100_000
+  assert renderer.outputs.get(("big-1.0.0", digest)) is None
+  assert renderer.outputs.weight <= 50_000
+
+
+def test_invalid_templates_are_compiled_once(tmp_path, monkeypatch):
+  book_path = tmp_path / "broken.book"
+  write_book(book_path, {"main.conf": "{% if %}"})
+  renderer = BookRenderer()
+  compiles = []
+  compile_book = renderer._compile_book
+  monkeypatch.setattr(renderer, "_compile_book", lambda *args: compiles.append(args) or compile_book(*args))
+
+  for _ in range(3):
+    with pytest.raises(HTTPException) as raised:
+      asyncio.run(renderer.render("broken-1.0.0", book_path, {}))
+    assert raised.value.status_code == 400
+    assert "Invalid template in 'broken-1.0.0'" in raised.value.detail
+  assert len(compiles) == 1
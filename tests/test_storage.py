@@ -0,0 +1,130 @@
+import os
+import threading
+
+import pytest
+
+from app.services.storage import BookStorage
+
+
+def make_flat_books(storage: BookStorage, count: int) -> list:
+  storage.root.mkdir(parents=True, exist_ok=True)
+  names = [f"book-{i}-1.0.0.book" for i in range(count)]
+  for name in names:
+    storage.flat_path(name).write_bytes(name.encode())
+  return names
+
+
+def test_path_for_is_sharded_under_root(tmp_path):
+  storage = BookStorage(str(tmp_path))
+  path = storage.path_for("nginx-1.2.0.book")
+  assert path.name == "nginx-1.2.0.book"
+  assert path.parent.parent.parent == storage.root
+  assert len(path.parent.name) == 2 and len(path.parent.parent.name) == 2
+
+
+@pytest.mark.parametrize("filename", [
+  "../../../../tmp/pwned-1.book",
+  "../escape.book",
+  "/etc/passwd",
+  "..",
+])
+def test_paths_outside_root_are_rejected(tmp_path, filename):
+  storage = BookStorage(str(tmp_path / "books"))
+  with pytest.raises(ValueError):
+    storage.path_for(filename)
+  with pytest.raises(ValueError):
+    storage.flat_path(filename)
+  assert storage.locate(filename) is None
+
+
+def test_store_never_writes_outside_root(tmp_path):
+  storage = BookStorage(str(tmp_path / "books"))
+  source = tmp_path / "upload.book"
+  source.write_bytes(b"package")
+  with pytest.raises(ValueError):
+    storage.store(source, "../../../../outside/pwned-1.book")
+  assert source.exists()
+  assert not any((tmp_path / name).exists() for name in ("outside",))
+
+
+def test_store_and_locate(tmp_path):
+  storage = BookStorage(str(tmp_path))
+  source = tmp_path / "upload.book"
+  source.write_bytes(b"package")
+  stored = storage.store(source, "a-1.0.0.book")
+  assert stored == storage.path_for("a-1.0.0.book")
+  assert storage.locate("a-1.0.0.book") == stored
+  assert storage.locate("missing-1.0.0.book") is None
+  assert set(storage.scan()) == {"a-1.0.0.book"}
+
+
+def test_migrate_moves_flat_books_into_shards(tmp_path):
+  storage = BookStorage(str(tmp_path))
+  names = make_flat_books(storage, 20)
+
+  assert storage.migrate() == len(names)
+  assert list(storage.iter_flat()) == []
+  for name in names:
+    assert not storage.flat_path(name).exists()
+    assert storage.locate(name) == storage.path_for(name)
+    assert storage.path_for(name).read_bytes() == name.encode()
+  assert storage.migrate() == 0
+
+
+def test_migrate_dry_run_moves_nothing(tmp_path):
+  storage = BookStorage(str(tmp_path))
+  names = make_flat_books(storage, 5)
+
+  assert storage.migrate(dry_run=True) == len(names)
+  for name in names:
+    assert storage.flat_path(name).exists()
+    assert not storage.path_for(name).exists()
+
+
+def test_migrate_completes_an_interrupted_run(tmp_path):
+  storage = BookStorage(str(tmp_path))
+  names = make_flat_books(storage, 3)
+  # An earlier run linked the first book into its shard and stopped before unlinking.
+  interrupted = storage.path_for(names[0])
+  interrupted.parent.mkdir(parents=True)
+  os.link(storage.flat_path(names[0]), interrupted)
+
+  assert storage.migrate() == len(names)
+  assert list(storage.iter_flat()) == []
+  for name in names:
+    assert storage.path_for(name).read_bytes() == name.encode()
+
+
+def test_locate_finds_books_in_every_migration_state(tmp_path):
+  storage = BookStorage(str(tmp_path))
+  name = make_flat_books(storage, 1)[0]
+  flat, sharded = storage.flat_path(name), storage.path_for(name)
+
+  assert storage.locate(name) == flat # Not migrated yet
+  sharded.parent.mkdir(parents=True)
+  os.link(flat, sharded)
+  assert storage.locate(name) == sharded # Linked, flat name not yet removed
+  os.unlink(flat)
+  assert storage.locate(name) == sharded # Migrated
+
+
+def test_locate_during_concurrent_migration(tmp_path):
+  storage = BookStorage(str(tmp_path))
+  names = make_flat_books(storage, 300)
+  missing = []
+  done = threading.Event()
+
+  def reader():
+    while not done.is_set():
+      for name in names:
+        if storage.locate(name) is None:
+          missing.append(name)
+
+  thread = threading.Thread(target=reader)
+  thread.start()
+  try:
+    assert storage.migrate() == len(names)
+  finally:
+    done.set()
+    thread.join()
+  assert missing == []